@@ -0,0 +1,120 @@
+import queue
+import random
+import threading
+import time as time
+from collections import defaultdict
+from cassandra.query import BatchStatement, BatchType
+from cassandra.concurrent import execute_concurrent
+from DB_profiles import PROFILE_FANOUT
+
+
+class FanoutPipeline:
+    """
+    Fan-out on write of references to new tweets into the followers' tweets_cache partitions, off the request path.
+    Jobs are queued by Tweet_DB.post_tweet once the tweet itself is written. Worker threads group the
+    cache inserts by replica (token aware) into small unlogged batches, send them with bounded
+    concurrency and retry failed batches with backoff. Trimming is left to the background trimmer.
+    """
+    def __init__(self, tweet_db, workers=2, batch_size=50, concurrency=20, max_retries=3, backoff=0.2):
+        self.tweet_db = tweet_db
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"jobs_submitted": 0, "jobs_done": 0, "jobs_failed": 0,
+                       "cache_writes": 0, "batches": 0, "batch_retries": 0,
+                       "last_lag_seconds": None, "max_lag_seconds": 0.0}
+        self._pending_since = {}
+        self._workers = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, tweet, follower_ids):
+        job_id = object()
+        with self._lock:
+            self._stats["jobs_submitted"] += 1
+            self._pending_since[job_id] = time.time()
+        self._jobs.put((job_id, tweet, list(follower_ids)))
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            job_id, tweet, follower_ids = job
+            try:
+                self._fan_out(tweet, follower_ids)
+                failed = False
+            except Exception as e:
+                print(f"Fan-out of tweet {tweet['tweet_id']} failed: {e}")
+                failed = True
+            with self._lock:
+                lag = time.time() - self._pending_since.pop(job_id)
+                self._stats["jobs_failed" if failed else "jobs_done"] += 1
+                self._stats["last_lag_seconds"] = round(lag, 3)
+                self._stats["max_lag_seconds"] = round(max(self._stats["max_lag_seconds"], lag), 3)
+
+    def _batches_by_replica(self, tweet, follower_ids):
+        insert_cache = self.tweet_db.statements.get("insert_cache")
+        metadata = self.tweet_db.cluster.metadata
+        groups = defaultdict(list)
+        for follower_id in follower_ids:
+            bound = insert_cache.bind((int(follower_id), tweet['tweet_id'], tweet['tweet_date'],
+                                       tweet['user_id'], self.tweet_db.cache_ttl))
+            replicas = metadata.get_replicas(self.tweet_db.keyspace, bound.routing_key)
+            groups[replicas[0] if replicas else None].append(bound)
+
+        batches = []
+        for statements in groups.values():
+            for start in range(0, len(statements), self.batch_size):
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+                for bound in statements[start:start + self.batch_size]:
+                    batch.add(bound)
+                batches.append(batch)
+        return batches
+
+    def _fan_out(self, tweet, follower_ids):
+        batches = self._batches_by_replica(tweet, follower_ids)
+        for attempt in range(self.max_retries + 1):
+            results = execute_concurrent(self.tweet_db.session, [(batch, None) for batch in batches],
+                                         concurrency=self.concurrency, raise_on_first_error=False,
+                                         execution_profile=PROFILE_FANOUT)
+            failed = [batch for batch, (success, _) in zip(batches, results) if not success]
+            with self._lock:
+                self._stats["batches"] += len(batches) - len(failed)
+                self._stats["cache_writes"] += sum(len(batch) for batch, (success, _) in zip(batches, results) if success)
+            if not failed:
+                break
+            if attempt == self.max_retries:
+                raise RuntimeError(f"{len(failed)} cache batches failed after {self.max_retries} retries")
+            with self._lock:
+                self._stats["batch_retries"] += len(failed)
+            batches = failed
+            time.sleep(self.backoff * (2 ** attempt) + random.uniform(0, self.backoff))
+        self.tweet_db.mark_caches_dirty(follower_ids)
+
+    def stats(self):
+        """
+        Counters of the pipeline and its current lag, the age of the oldest unfinished fan-out.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            oldest = min(self._pending_since.values(), default=None)
+        stats["queued_jobs"] = self._jobs.qsize()
+        stats["current_lag_seconds"] = round(time.time() - oldest, 3) if oldest is not None else 0.0
+        return stats
+
+    def close(self, timeout=30.0):
+        """
+        Let the workers finish the queued fan-outs, waiting at most timeout seconds in total.
+        """
+        for _ in self._workers:
+            self._jobs.put(None)
+        deadline = time.time() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.time()))
+        unfinished = len(self._pending_since)
+        if unfinished:
+            print(f"Fan-out pipeline closed with {unfinished} unfinished jobs after {timeout} seconds.")
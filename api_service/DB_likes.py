@@ -0,0 +1,115 @@
+import threading
+import time as time
+from cassandra import WriteTimeout, OperationTimedOut
+
+
+class LikeBuffer:
+    """
+    Coalesces likes per tweet before the denormalized number_of_likes columns are written.
+    Tweet_DB.like_tweet records every like in tweet_likes and adds it here. Every flush_interval
+    seconds the buffered likes of a tweet are added to its tweet_like_counts counter in one
+    increment, and the new total is written to tweets_by_date, tweets_by_likes and tweets_by_id once,
+    however many likes arrived in between.
+    Counter increments are not idempotent, so likes are only buffered again if their increment
+    surely failed. A failed write of the totals is retried on its own, with the value read from the counter.
+    """
+    def __init__(self, tweet_db, flush_interval=1.0):
+        self.tweet_db = tweet_db
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # one flush at a time, the flush thread and callers like init_random_likes share the buffer
+        self._flush_lock = threading.Lock()
+        # (author_id, tweet_date, tweet_id) -> likes not yet added to the counter
+        self._pending = {}
+        # tweets whose counter is ahead of their number_of_likes columns
+        self._unwritten = set()
+        self._stats = {"likes": 0, "flushes": 0, "tweets_flushed": 0, "increment_errors": 0,
+                       "uncertain_increments": 0, "write_errors": 0, "last_flush_seconds": None}
+        self._stop_event = threading.Event()
+        self._flush_thread = None
+        if flush_interval:
+            self.start(flush_interval)
+
+    def add(self, author_id, tweet_date, tweet_id, likes=1):
+        key = (int(author_id), tweet_date, tweet_id)
+        with self._lock:
+            self._stats["likes"] += likes
+            self._pending[key] = self._pending.get(key, 0) + likes
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                unwritten, self._unwritten = self._unwritten, set()
+            if not pending and not unwritten:
+                return 0
+            start_time = time.time()
+
+            keys = list(pending)
+            try:
+                # one concurrent pass for all tweets with buffered likes
+                results = self.tweet_db.increment_like_counts([(key[2], pending[key]) for key in keys])
+            except Exception as e:
+                # nothing was sent
+                print(f"Incrementing the like counters of {len(keys)} tweets failed: {e}")
+                results = [(False, None)] * len(keys)
+            failed_increments = {}
+            uncertain = 0
+            for key, (success, result) in zip(keys, results):
+                if success:
+                    unwritten.add(key)
+                elif isinstance(result, (WriteTimeout, OperationTimedOut)):
+                    # the increment may have been applied, adding it again could count the likes twice
+                    print(f"Incrementing the like counter of tweet {key[2]} timed out, {pending[key]} likes may be lost: {result}")
+                    uncertain += 1
+                    unwritten.add(key)
+                else:
+                    failed_increments[key] = pending[key]
+
+            try:
+                failed_writes = self.tweet_db.write_like_totals(unwritten)
+            except Exception as e:
+                print(f"Writing the like totals of {len(unwritten)} tweets failed: {e}")
+                failed_writes = list(unwritten)
+
+            with self._lock:
+                # written again with the next pass
+                for key, likes in failed_increments.items():
+                    self._pending[key] = self._pending.get(key, 0) + likes
+                self._unwritten.update(failed_writes)
+                self._stats["flushes"] += 1
+                self._stats["tweets_flushed"] += len(unwritten) - len(failed_writes)
+                self._stats["increment_errors"] += len(failed_increments)
+                self._stats["uncertain_increments"] += uncertain
+                self._stats["write_errors"] += len(failed_writes)
+                self._stats["last_flush_seconds"] = round(time.time() - start_time, 3)
+            return len(unwritten) - len(failed_writes)
+
+    def start(self, interval=1.0):
+        def flush_loop():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error flushing the like buffer: {e}")
+
+        if self._flush_thread is None:
+            self._stop_event.clear()
+            self._flush_thread = threading.Thread(target=flush_loop, daemon=True)
+            self._flush_thread.start()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_tweets"] = len(self._pending)
+            stats["pending_likes"] = sum(self._pending.values())
+            stats["unwritten_tweets"] = len(self._unwritten)
+        return stats
+
+    def close(self):
+        self._stop_event.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+        # write what is still buffered
+        self.flush()
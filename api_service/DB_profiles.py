@@ -0,0 +1,38 @@
+from cassandra import ConsistencyLevel
+from cassandra.cluster import ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import TokenAwarePolicy, DCAwareRoundRobinPolicy, ConstantSpeculativeExecutionPolicy
+
+# interactive reads and writes of the API use the default profile
+PROFILE_INTERACTIVE = EXEC_PROFILE_DEFAULT
+PROFILE_FANOUT = "fanout"
+PROFILE_BULK = "bulk"
+
+
+def build_execution_profiles(local_dc=None, consistency="LOCAL_ONE", bulk_consistency="LOCAL_QUORUM",
+                             request_timeout=2.0, fanout_timeout=10.0, bulk_timeout=60.0,
+                             speculative_delay=0.05, speculative_attempts=2):
+    """
+    Execution profiles of Tweet_DB, one per workload. All of them route token aware to a replica
+    in the local data center (local_dc=None takes the data center of the contact points).
+    - interactive: short timeout, speculative executions of idempotent statements against a slow replica
+    - fanout: background cache writes, longer timeout, no speculation
+    - bulk: imports and seeding, long timeout and replicas shuffled to spread the write load
+    """
+    def load_balancing(shuffle_replicas=False):
+        return TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=local_dc), shuffle_replicas=shuffle_replicas)
+
+    speculative = None
+    if speculative_delay:
+        speculative = ConstantSpeculativeExecutionPolicy(speculative_delay, speculative_attempts)
+    return {
+        PROFILE_INTERACTIVE: ExecutionProfile(load_balancing_policy=load_balancing(),
+                                              consistency_level=ConsistencyLevel.name_to_value[consistency],
+                                              request_timeout=request_timeout,
+                                              speculative_execution_policy=speculative),
+        PROFILE_FANOUT: ExecutionProfile(load_balancing_policy=load_balancing(),
+                                         consistency_level=ConsistencyLevel.LOCAL_ONE,
+                                         request_timeout=fanout_timeout),
+        PROFILE_BULK: ExecutionProfile(load_balancing_policy=load_balancing(shuffle_replicas=True),
+                                       consistency_level=ConsistencyLevel.name_to_value[bulk_consistency],
+                                       request_timeout=bulk_timeout),
+    }
@@ -0,0 +1,49 @@
+from cassandra import InvalidRequest
+
+
+class StatementRegistry:
+    """
+    Registry of the CQL statements used by Tweet_DB.
+    Every statement is prepared once per session and bound positionally, so Cassandra does not
+    parse it again on every call and the driver can route it token aware.
+    Prepared statements are dropped on schema changes (invalidate) and prepared again on first use.
+    """
+    def __init__(self, session):
+        self.session = session
+        self._queries = {}
+        self._prepared = {}
+
+    def register(self, name, query):
+        self._queries[name] = query
+        self._prepared.pop(name, None)
+
+    def get(self, name):
+        prepared = self._prepared.get(name)
+        if prepared is None:
+            prepared = self.session.prepare(self._queries[name])
+            # reads may be sent again by the speculative execution policy, writes are not
+            prepared.is_idempotent = self._queries[name].lstrip().upper().startswith("SELECT")
+            self._prepared[name] = prepared
+        return prepared
+
+    def prepare_all(self):
+        for name in self._queries:
+            try:
+                self.get(name)
+            except InvalidRequest as e:
+                # e.g. the table does not exist yet, the statement is prepared on first use
+                print(f"Could not prepare statement {name}: {e}")
+
+    def invalidate(self):
+        self._prepared.clear()
+
+    def bind(self, name, values=()):
+        return self.get(name).bind(values)
+
+    def execute(self, name, values=(), **kwargs):
+        try:
+            return self.session.execute(self.get(name), values, **kwargs)
+        except InvalidRequest:
+            # the schema changed since the statement was prepared, prepare it again and retry once
+            self._prepared.pop(name, None)
+            return self.session.execute(self.get(name), values, **kwargs)
@@ -1,23 +1,64 @@
 import pandas as pd
 import numpy as np
 from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType
 from cassandra.auth import PlainTextAuthProvider
-from datetime import datetime
+from cassandra import InvalidRequest
+from cassandra.protocol import ProtocolException
+from datetime import datetime, timedelta
 import requests
 # from uuid import uuid4 as uuid
 import uuid
+import hashlib
+import base64
+import binascii
+import heapq
+import re
+import queue
+import threading
+from collections import OrderedDict, deque, namedtuple
+from itertools import islice
 from datetime import datetime
 from cassandra.util import uuid_from_time
+from DB_statements import StatementRegistry
+from DB_fanout import FanoutPipeline
+from DB_likes import LikeBuffer
+from DB_profiles import build_execution_profiles, PROFILE_FANOUT, PROFILE_BULK
+
+# tweet of a timeline, hydrated from a tweets_cache reference or pulled from tweets_by_date
+CacheRow = namedtuple("Row", ["follower_id", "tweet_date", "tweet_id", "content", "number_of_likes", "author_id"])
+
 
 class Tweet_DB:
-    def __init__(self, hosts, keyspace, auth_provider=None):
+    def __init__(self, hosts, keyspace, auth_provider=None, port=9042, execution_profiles=None, compression=True, fetch_size=100,
+                 cache_size=25, cache_ttl=7 * 24 * 3600, cache_trim_interval=60,
+                 fanout_threshold=None, like_flush_interval=1.0, tweet_body_cache_size=10000):
         self.keyspace = keyspace
+        # authors with more followers than fanout_threshold are not fanned out, their tweets are
+        # pulled from tweets_by_date when a timeline is read (None disables the hybrid mode)
+        self.fanout_threshold = fanout_threshold
+        self._timeline_lock = threading.Lock()
+        self.timeline_stats = {"posts_pushed": 0, "posts_pulled": 0, "cache_writes": 0,
+                               "cache_writes_saved": 0, "timeline_reads": 0, "pulled_author_reads": 0}
+        # tweets_cache keeps the newest cache_size tweets per follower, entries expire after cache_ttl seconds (0 = never)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        # LRU of hot tweet bodies from tweets_by_id, used to hydrate the cached references (0 disables it)
+        self.tweet_body_cache = OrderedDict()
+        self.tweet_body_cache_size = tweet_body_cache_size
+        self._body_cache_lock = threading.Lock()
+        # one execution profile per workload, see DB_profiles; schema changes use the long timeout of the bulk profile
+        if execution_profiles is None:
+            execution_profiles = build_execution_profiles()
         if auth_provider:
-            self.cluster = Cluster(hosts, auth_provider=auth_provider)
+            self.cluster = Cluster(hosts, port=port, auth_provider=auth_provider, execution_profiles=execution_profiles,
+                                   compression=compression)
         else:
-            self.cluster = Cluster(hosts)
+            self.cluster = Cluster(hosts, port=port, execution_profiles=execution_profiles, compression=compression)
         
         self.session = self.cluster.connect()
+        self.session.default_fetch_size = fetch_size
 
         # Check if the keyspace exists
         keyspace_exists = self.session.execute("""
@@ -29,18 +70,147 @@ class Tweet_DB:
                 CREATE KEYSPACE IF NOT EXISTS {keyspace}
                 WITH replication = {{'class': 'SimpleStrategy', 'replication_factor': '1'}}
                 AND durable_writes = true;
-            """)
+            """, execution_profile=PROFILE_BULK)
 
         self.session.set_keyspace(keyspace)  # Connect to the keyspace
 
+        self.statements = StatementRegistry(self.session)
+        self._register_statements()
+
         # date sorted table
-        self.setup_all_tables
+        self.setup_all_tables()
+
+        # fan-out of new tweets into the followers' caches, in the background
+        self.fanout = FanoutPipeline(self)
+
+        # likes are coalesced per tweet and their totals written every like_flush_interval seconds
+        self.likes = LikeBuffer(self, flush_interval=like_flush_interval)
+
+        # caches written to since the last trim, trimmed in the background instead of on every write
+        self._dirty_caches = set()
+        self._dirty_lock = threading.Lock()
+        self._trim_stop = threading.Event()
+        self._trim_thread = None
+        if cache_trim_interval:
+            self.start_cache_trimmer(cache_trim_interval)
     
     def setup_all_tables(self):
         self.setup_initial_table(sorted_by_date=True)
         self.setup_initial_table(sorted_by_date=False)
+        self.setup_tweets_by_id_table()
         self.setup_cache_table()
         self.setup_likes_table()
+        self.setup_like_counts_table()
+        self.setup_word_index_table()
+        self.setup_user_mapping_table()
+        self.setup_import_checkpoint_table()
+        self.setup_imported_files_table()
+        self.setup_table_counts_table()
+        # prepare the statements against the current schema
+        self.statements.invalidate()
+        self.statements.prepare_all()
+
+    def _register_statements(self):
+        register = self.statements.register
+        # tweets_by_date
+        register("insert_tweet_by_date", """
+            INSERT INTO tweets_by_date (user_id, tweet_id, tweet_date, content, number_of_likes)
+            VALUES (?, ?, ?, ?, ?)
+        """)
+        register("select_tweets_by_date", """
+            SELECT user_id, tweet_id, tweet_date, content, number_of_likes
+            FROM tweets_by_date WHERE user_id = ? LIMIT ?
+        """)
+        register("select_tweets_by_date_after", """
+            SELECT user_id, tweet_id, tweet_date, content, number_of_likes
+            FROM tweets_by_date WHERE user_id = ? AND (tweet_date, tweet_id) < (?, ?) LIMIT ?
+        """)
+        register("select_user_tweets_by_date", """
+            SELECT user_id, tweet_id, tweet_date, content, number_of_likes
+            FROM tweets_by_date WHERE user_id = ?
+        """)
+        register("scan_tweets_by_date", "SELECT user_id, tweet_id, tweet_date, content, number_of_likes FROM tweets_by_date")
+        register("select_tweet_likes_by_date", "SELECT user_id, tweet_id, tweet_date FROM tweets_by_date WHERE user_id = ? LIMIT ?")
+        register("update_likes_by_date", "UPDATE tweets_by_date SET number_of_likes = ? WHERE user_id = ? AND tweet_date = ? AND tweet_id = ?")
+        register("count_tweets_by_date", "SELECT COUNT(*) FROM tweets_by_date")
+        register("select_tweet_by_key", """
+            SELECT user_id, tweet_id, tweet_date, content, number_of_likes
+            FROM tweets_by_date WHERE user_id = ? AND tweet_date = ? AND tweet_id = ?
+        """)
+        # tweets_by_id
+        register("insert_tweet_by_id", """
+            INSERT INTO tweets_by_id (tweet_id, user_id, tweet_date, content, number_of_likes)
+            VALUES (?, ?, ?, ?, ?)
+        """)
+        register("select_tweet_by_id", "SELECT tweet_id, user_id, tweet_date, content, number_of_likes FROM tweets_by_id WHERE tweet_id = ?")
+        register("update_likes_by_id", "UPDATE tweets_by_id SET number_of_likes = ? WHERE tweet_id = ?")
+        # tweets_by_word
+        register("insert_word_posting", "INSERT INTO tweets_by_word (word, user_id, tweet_date, tweet_id) VALUES (?, ?, ?, ?)")
+        register("select_word_postings", "SELECT tweet_date, tweet_id FROM tweets_by_word WHERE word = ? AND user_id = ? LIMIT ?")
+        register("select_word_postings_after", """
+            SELECT tweet_date, tweet_id FROM tweets_by_word
+            WHERE word = ? AND user_id = ? AND (tweet_date, tweet_id) < (?, ?) LIMIT ?
+        """)
+        # tweets_by_likes
+        register("insert_tweet_by_likes", """
+            INSERT INTO tweets_by_likes (user_id, number_of_likes, tweet_id, tweet_date, content)
+            VALUES (?, ?, ?, ?, ?)
+        """)
+        register("select_tweets_by_likes", """
+            SELECT user_id, tweet_id, tweet_date, content, number_of_likes
+            FROM tweets_by_likes WHERE user_id = ? LIMIT ?
+        """)
+        register("select_tweets_by_likes_after", """
+            SELECT user_id, tweet_id, tweet_date, content, number_of_likes
+            FROM tweets_by_likes WHERE user_id = ? AND (number_of_likes, tweet_id) < (?, ?) LIMIT ?
+        """)
+        register("select_user_tweets_by_likes", """
+            SELECT user_id, number_of_likes, tweet_id, tweet_date, content
+            FROM tweets_by_likes WHERE user_id = ?
+        """)
+        register("select_user_tweets_by_likes_limit", """
+            SELECT user_id, number_of_likes, tweet_id, tweet_date, content
+            FROM tweets_by_likes WHERE user_id = ? LIMIT ?
+        """)
+        register("delete_tweet_by_likes", "DELETE FROM tweets_by_likes WHERE user_id = ? AND tweet_id = ? AND number_of_likes = ?")
+        # tweet_likes
+        # lightweight transaction, a repeated like by the same user is not counted again
+        register("insert_like", "INSERT INTO tweet_likes (tweet_id, user_id) VALUES (?, ?) IF NOT EXISTS")
+        register("select_likers_in", "SELECT user_id FROM tweet_likes WHERE tweet_id = ? AND user_id IN ?")
+        # tweet_like_counts
+        register("select_like_count", "SELECT likes FROM tweet_like_counts WHERE tweet_id = ?")
+        register("increment_like_count", "UPDATE tweet_like_counts SET likes = likes + ? WHERE tweet_id = ?")
+        # tweets_cache
+        register("insert_cache", """
+            INSERT INTO tweets_cache (follower_id, tweet_id, tweet_date, author_id)
+            VALUES (?, ?, ?, ?) USING TTL ?
+        """)
+        register("select_cache_dates", "SELECT tweet_date FROM tweets_cache WHERE follower_id = ? LIMIT ?")
+        register("delete_cache_older", "DELETE FROM tweets_cache WHERE follower_id = ? AND tweet_date < ?")
+        register("select_cache", "SELECT follower_id, tweet_date, tweet_id, author_id FROM tweets_cache WHERE follower_id = ? LIMIT ?")
+        register("select_cache_after", """
+            SELECT follower_id, tweet_date, tweet_id, author_id FROM tweets_cache
+            WHERE follower_id = ? AND (tweet_date, tweet_id) < (?, ?) LIMIT ?
+        """)
+        # user_mapping
+        register("count_user_mapping", "SELECT COUNT(*) FROM user_mapping WHERE user_id = ?")
+        register("insert_user_mapping", "INSERT INTO user_mapping (user_id, username) VALUES (?, ?)")
+        register("update_user_mapping", "UPDATE user_mapping SET username = ? WHERE user_id = ?")
+        register("select_username", "SELECT username FROM user_mapping WHERE user_id = ?")
+        # import_checkpoints
+        register("select_import_checkpoint", "SELECT committed_rows, author_ids FROM import_checkpoints WHERE csv_file = ?")
+        register("upsert_import_checkpoint", "INSERT INTO import_checkpoints (csv_file, committed_rows, author_ids) VALUES (?, ?, ?)")
+        register("delete_import_checkpoint", "DELETE FROM import_checkpoints WHERE csv_file = ?")
+        # imported_files
+        register("select_imported_rows", "SELECT imported_rows FROM imported_files WHERE csv_file = ?")
+        register("upsert_imported_rows", "INSERT INTO imported_files (csv_file, imported_rows) VALUES (?, ?)")
+        register("select_user_id", "SELECT user_id FROM user_mapping WHERE username = ? ALLOW FILTERING")
+        # table_counts
+        register("select_table_count", "SELECT row_count FROM table_counts WHERE table_name = ?")
+        register("increment_table_count", "UPDATE table_counts SET row_count = row_count + ? WHERE table_name = ?")
+        register("select_size_estimates", """
+            SELECT partitions_count FROM system.size_estimates WHERE keyspace_name = ? AND table_name = ?
+        """)
 
     def setup_initial_table(self, sorted_by_date=True):
         if sorted_by_date:
@@ -65,21 +235,60 @@ class Tweet_DB:
                 PRIMARY KEY (user_id, number_of_likes, tweet_id)
             ) WITH CLUSTERING ORDER BY (number_of_likes DESC, tweet_id DESC);
             """
-        self.session.execute(create_table_query)
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def setup_tweets_by_id_table(self):
+        # one row per tweet, the timeline caches only reference it
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS tweets_by_id (
+            tweet_id uuid PRIMARY KEY,
+            user_id int,
+            tweet_date timestamp,
+            content text,
+            number_of_likes int
+        );
+        """
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
 
     def setup_cache_table(self):
+        if self._has_legacy_cache_table():
+            # dropping the cache is left to migrate_cache_table, it is never done implicitly
+            print("tweets_cache has the old layout, rebuild it with the migrate_cache_table command")
+            return
         create_table_query = """
         CREATE TABLE IF NOT EXISTS tweets_cache (
             follower_id int,
             tweet_id uuid,
             tweet_date timestamp,
-            content text,
-            number_of_likes int,
+            author_id int,
             PRIMARY KEY (follower_id, tweet_date, tweet_id)
         ) WITH CLUSTERING ORDER BY (tweet_date DESC, tweet_id DESC);
         """
-        self.session.execute(create_table_query)
-    
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def _has_legacy_cache_table(self):
+        # a cache of the old layout holds copies of the tweets instead of references
+        legacy_column = self.session.execute("""
+            SELECT column_name FROM system_schema.columns
+            WHERE keyspace_name = %s AND table_name = 'tweets_cache' AND column_name = 'content'
+        """, (self.keyspace,)).one()
+        return legacy_column is not None
+
+    def migrate_cache_table(self):
+        """
+        Drop a tweets_cache of the old layout and create it with references to tweets_by_id.
+        The timelines are empty afterwards until they are filled again. Returns False if the
+        cache already has the current layout.
+        """
+        if not self._has_legacy_cache_table():
+            return False
+        print("Dropping tweets_cache of the old layout")
+        self.session.execute("DROP TABLE tweets_cache", execution_profile=PROFILE_BULK)
+        self.setup_cache_table()
+        # the cache statements were prepared against the old table
+        self.statements.invalidate()
+        return True
+
     def setup_likes_table(self):
         create_table_query = """
         CREATE TABLE IF NOT EXISTS tweet_likes (
@@ -88,25 +297,77 @@ class Tweet_DB:
             PRIMARY KEY (tweet_id, user_id)
         ) WITH CLUSTERING ORDER BY (user_id ASC);
         """
-        self.session.execute(create_table_query)
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def setup_like_counts_table(self):
+        # authoritative like totals, counters merge concurrent increments without lost updates
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS tweet_like_counts (
+            tweet_id uuid PRIMARY KEY,
+            likes counter
+        );
+        """
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def setup_word_index_table(self):
+        # posting lists of the words used by a user, newest tweets first
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS tweets_by_word (
+            word text,
+            user_id int,
+            tweet_date timestamp,
+            tweet_id uuid,
+            PRIMARY KEY ((word, user_id), tweet_date, tweet_id)
+        ) WITH CLUSTERING ORDER BY (tweet_date DESC, tweet_id DESC);
+        """
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def setup_user_mapping_table(self):
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS user_mapping (
+            user_id int PRIMARY KEY,
+            username text
+        );
+        """
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def setup_import_checkpoint_table(self):
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            csv_file text PRIMARY KEY,
+            committed_rows bigint,
+            author_ids map<text, int>
+        );
+        """
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def setup_imported_files_table(self):
+        # rows of a csv file ever written, tweet ids are derived from the row number, so rows below
+        # imported_rows are overwritten by a new import and must not be counted again
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS imported_files (
+            csv_file text PRIMARY KEY,
+            imported_rows bigint
+        );
+        """
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
+
+    def setup_table_counts_table(self):
+        # row counts kept up to date by the write paths, so counting never scans a table
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS table_counts (
+            table_name text PRIMARY KEY,
+            row_count counter
+        );
+        """
+        self.session.execute(create_table_query, execution_profile=PROFILE_BULK)
 
     def get_tweets_by_user(self, user_id, limit=None):
-        # Prepare the query
-        query = """
-        SELECT user_id, number_of_likes, tweet_id, tweet_date, content
-        FROM tweets_by_likes
-        WHERE user_id = %s;
-        """
-        # Initialize parameters list with user_id
-        params = [user_id]
-        
-        # Add LIMIT clause and parameter if limit is provided
+        # Execute the prepared query, with LIMIT if limit is provided
         if limit is not None:
-            query += " LIMIT %s"
-            params.append(limit)
-        
-        # Execute the query with dynamic parameters
-        rows = self.session.execute(query, params)
+            rows = self.statements.execute("select_user_tweets_by_likes_limit", (user_id, limit))
+        else:
+            rows = self.statements.execute("select_user_tweets_by_likes", (user_id,))
     
         # Process and return the results
         tweets = []
@@ -121,69 +382,252 @@ class Tweet_DB:
 
         return tweets
 
-    def init_random_likes(self, user_id, liker_ids, n_likes=10, n_tweets=10):
-        query = "SELECT tweet_id, number_of_likes, tweet_date FROM tweets_by_date WHERE user_id = %s ORDER BY tweet_date DESC"
-        result = self.session.execute(query, (user_id,))
-        tweet_ids = []
-        number_of_likes = []
-        tweet_dates = []
-        for re in result:
-            tweet_ids.append(re.tweet_id)
-            number_of_likes.append(re.number_of_likes)
-            tweet_dates.append(re.tweet_date)
-
-        tweet_ids = tweet_ids[:n_tweets]
-        number_of_likes = number_of_likes[:n_tweets]
-        tweet_dates = tweet_dates[:n_tweets]
-
-
-        for tweet_idx, tweet_id in enumerate(tweet_ids):
-            print(f'For tweet: {tweet_idx + 1} of {len(tweet_ids)}, likes are being added')
-            # Get a random list of user_ids with length of n_likes
-            random_user_ids = np.random.choice(liker_ids, min(n_likes, len(liker_ids)), replace=False)
-            
-            for user_id in random_user_ids:
-                insert_query = "INSERT INTO tweet_likes (tweet_id, user_id) VALUES (%s, %s)"
-                self.session.execute(insert_query, (tweet_id, user_id))
-    
-    def like_tweet(self, author_id, liker_id, tweet_id, number_of_likes, tweet_date, content, user_followers):
-        """
-        # check if the user has already liked the tweet
-        query = "SELECT COUNT(*) FROM tweet_likes WHERE tweet_id = %s AND user_id = %s"
-        result = self.session.execute(query, (tweet_id, user_id))
-        count = result.one().count
-        #rint(count)
-        if count > 0:
-            print("User has already liked the tweet")
-            return
+    def get_tweets_page(self, user_id, page_size=25, paging_state=None):
+        """
+        One page of the user's tweets, newest first. The driver's paging state of the last page is
+        passed back in, so Cassandra resumes the partition scan where it stopped instead of skipping rows.
+        Returns the rows and the paging state of the next page (None after the last page).
+        Raises ValueError if Cassandra rejects the paging state.
+        """
+        statement = self.statements.bind("select_user_tweets_by_date", (user_id,))
+        statement.fetch_size = page_size
+        try:
+            result = self.session.execute(statement, paging_state=paging_state)
+        except (ProtocolException, InvalidRequest) as e:
+            # a cursor which is not a paging state of this statement, e.g. a keyset cursor of get_tweets
+            if paging_state is None:
+                raise
+            raise ValueError("Invalid cursor") from e
+        return list(result.current_rows), result.paging_state
+
+    @staticmethod
+    def _to_millis(tweet_date):
+        # Cassandra timestamps have millisecond precision and come back as naive UTC datetimes
+        return (tweet_date - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+
+    @staticmethod
+    def encode_cursor(row, by_likes=False):
+        """
+        Opaque keyset cursor after row, the sort key of the last tweet of a merged timeline page.
+        """
+        if by_likes:
+            key = f"l:{row.number_of_likes}:{row.tweet_id}"
+        else:
+            key = f"d:{Tweet_DB._to_millis(row.tweet_date)}:{row.tweet_id}"
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor, by_likes=False):
+        try:
+            kind, value, tweet_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+            value, tweet_id = int(value), uuid.UUID(tweet_id)
+        except (ValueError, binascii.Error):
+            raise ValueError("Invalid cursor")
+        if kind != ("l" if by_likes else "d"):
+            raise ValueError("The cursor belongs to a different sort order")
+        if not by_likes:
+            value = datetime(1970, 1, 1) + timedelta(milliseconds=value)
+        return value, tweet_id
+
+    def init_random_likes(self, user_ids, liker_ids, n_likes=10, n_tweets=10, concurrency=100, seed=None):
+        """
+        Seed likes for the newest n_tweets of every user in user_ids: each tweet is liked by n_likes
+        distinct random users of liker_ids. The likes of all tweets are sampled at once, written with
+        bounded concurrency and added to the like totals in the same pass, through the like buffer.
+        Pairs which already are in tweet_likes do not count again.
+        """
+        if isinstance(user_ids, int):
+            user_ids = [user_ids]
+        liker_ids = np.asarray(liker_ids, dtype=np.int64)
+        n_likes = min(n_likes, len(liker_ids))
+        if n_likes == 0 or not user_ids:
+            return 0
+        start_time = datetime.now()
+        results = execute_concurrent_with_args(self.session, self.statements.get("select_tweet_likes_by_date"),
+                                               [(int(user_id), n_tweets) for user_id in user_ids], concurrency=concurrency,
+                                               execution_profile=PROFILE_BULK)
+        tweets = [row for success, rows in results for row in rows]
+        if not tweets:
+            return 0
+
+        # n_likes distinct likers per tweet: the positions of the n_likes smallest of a row of random keys,
+        # sampled for a block of tweets at a time to bound the memory
+        rng = np.random.default_rng(seed)
+        block_size = max(1, 4_000_000 // len(liker_ids))
+        likers = np.empty((len(tweets), n_likes), dtype=np.int64)
+        for start in range(0, len(tweets), block_size):
+            keys = rng.random((min(block_size, len(tweets) - start), len(liker_ids)))
+            likers[start:start + len(keys)] = liker_ids[np.argpartition(keys, n_likes - 1, axis=1)[:, :n_likes]]
+
+        likers = likers.tolist()
+        # drop the sampled pairs which already exist, they would inflate the totals
+        existing = execute_concurrent_with_args(self.session, self.statements.get("select_likers_in"),
+                                                [(tweet.tweet_id, row) for tweet, row in zip(tweets, likers)],
+                                                concurrency=concurrency, execution_profile=PROFILE_BULK)
+        new_likers = []
+        for row, (success, rows) in zip(likers, existing):
+            liked = {like.user_id for like in rows}
+            new_likers.append([liker_id for liker_id in row if liker_id not in liked])
+
+        # conditional inserts like like_tweet, a pair liked concurrently since the read is not counted twice
+        pairs = [(tweet, liker_id) for tweet, row in zip(tweets, new_likers) for liker_id in row]
+        inserted = execute_concurrent_with_args(self.session, self.statements.get("insert_like"),
+                                                [(tweet.tweet_id, liker_id) for tweet, liker_id in pairs],
+                                                concurrency=concurrency, raise_on_first_error=False,
+                                                execution_profile=PROFILE_BULK)
+        applied = {}
+        for (tweet, _), (success, result) in zip(pairs, inserted):
+            if success and result.was_applied:
+                applied[tweet] = applied.get(tweet, 0) + 1
+        # the totals are written by the like buffer, the only writer of the number_of_likes columns
+        for tweet, likes in applied.items():
+            self.likes.add(tweet.user_id, tweet.tweet_date, tweet.tweet_id, likes=likes)
+        self.likes.flush()
+        added = sum(applied.values())
+        print(f"Added {added} likes to {len(tweets)} tweets of {len(user_ids)} users "
+              f"in time: {round((datetime.now() - start_time).total_seconds(), 2)} seconds.")
+        return added
+
+    def get_tweet(self, tweet_id):
+        return self.statements.execute("select_tweet_by_id", (tweet_id,)).one()
+
+    def like_tweet(self, author_id, liker_id, tweet_id, tweet_date):
+        """
+        Record the like and leave the like totals to the like buffer, which writes them once per
+        flush for all likes of the tweet since the last one.
+        Returns False if the user had already liked the tweet, the like is then not counted again.
+        """
+        applied = self.statements.execute("insert_like", (tweet_id, liker_id)).was_applied
+        if applied:
+            self.likes.add(author_id, tweet_date, tweet_id)
+        return applied
+
+    def increment_like_counts(self, tweets, concurrency=50, execution_profile=PROFILE_FANOUT):
+        """
+        Add likes to the tweet_like_counts counters of the (tweet_id, likes) pairs.
+        Returns a (success, result_or_exception) pair per tweet, as execute_concurrent does.
+        """
+        return execute_concurrent_with_args(self.session, self.statements.get("increment_like_count"),
+                                            [(likes, tweet_id) for tweet_id, likes in tweets], concurrency=concurrency,
+                                            raise_on_first_error=False, execution_profile=execution_profile)
+
+    def write_like_totals(self, tweets, concurrency=50, execution_profile=PROFILE_FANOUT):
+        """
+        Write the counter totals of the (author_id, tweet_date, tweet_id) tweets to the denormalized
+        number_of_likes columns, one logged batch per tweet so the tables move together. The value is
+        always read from the counter, so a failed write can simply be repeated.
+        Returns the tweets whose write failed.
+        """
+        def run(name, params):
+            return execute_concurrent_with_args(self.session, self.statements.get(name), params, concurrency=concurrency,
+                                                raise_on_first_error=False, execution_profile=execution_profile)
+
+        tweets = list(tweets)
+        rows = run("select_tweet_by_key", tweets)
+        counts = run("select_like_count", [(tweet_id,) for author_id, tweet_date, tweet_id in tweets])
+        failed = []
+        batches = []
+        for tweet, (row_read, row), (count_read, count) in zip(tweets, rows, counts):
+            if not (row_read and count_read):
+                failed.append(tweet)
+                continue
+            row, count = row.one(), count.one()
+            if row is None or count is None or count.likes == row.number_of_likes:
+                continue
+            author_id, tweet_date, tweet_id = tweet
+            batch = BatchStatement(batch_type=BatchType.LOGGED)
+            # move the tweet in the tweets_by_likes table
+            batch.add(self.statements.get("delete_tweet_by_likes"), (author_id, tweet_id, row.number_of_likes))
+            batch.add(self.statements.get("insert_tweet_by_likes"), (author_id, count.likes, tweet_id, tweet_date, row.content))
+            # the caches only reference the tweet, its single tweets_by_id row carries the total
+            batch.add(self.statements.get("update_likes_by_id"), (count.likes, tweet_id))
+            batch.add(self.statements.get("update_likes_by_date"), (count.likes, author_id, tweet_date, tweet_id))
+            batches.append((tweet, batch))
+        results = execute_concurrent(self.session, [(batch, None) for tweet, batch in batches], concurrency=concurrency,
+                                     raise_on_first_error=False, execution_profile=execution_profile)
+        failed.extend(tweet for (tweet, batch), (success, result) in zip(batches, results) if not success)
+        with self._body_cache_lock:
+            for author_id, tweet_date, tweet_id in tweets:
+                self.tweet_body_cache.pop(tweet_id, None)
+        return failed
+
+    def get_tweet_count(self, estimated=False):
         """
-        number_of_likes += 1
-        # insert the like into the tweet_likes table
-        insert_query = "INSERT INTO tweet_likes (tweet_id, user_id) VALUES (%s, %s)"
-        self.session.execute(insert_query, (tweet_id, liker_id))
-        # update the tweets_by_date table
-        update_query = "UPDATE tweets_by_date SET number_of_likes = %s WHERE user_id = %s AND tweet_date = %s AND tweet_id = %s"
-        self.session.execute(update_query, (number_of_likes, author_id, tweet_date, tweet_id))
-        # delete the old tweet from tweets_by_likes table
-        delete_query = "DELETE FROM tweets_by_likes WHERE user_id = %s AND tweet_id = %s AND number_of_likes = %s"
-        self.session.execute(delete_query, (author_id, tweet_id, number_of_likes-1))
-        # insert the new tweet into the tweets_by_likes table
-        insert_query = """
-        INSERT INTO tweets_by_likes (user_id, number_of_likes, tweet_id, tweet_date, content)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        self.session.execute(insert_query, (author_id, number_of_likes, tweet_id, tweet_date, content))
-        # update the cache
-        # get all followers of the author
-        for follower_id in user_followers:
-            update_cache_query = "UPDATE tweets_cache SET number_of_likes = %s WHERE follower_id = %s AND tweet_date = %s AND tweet_id = %s"
-            self.session.execute(update_cache_query, (number_of_likes, follower_id, tweet_date, tweet_id))
-
-    def get_tweet_count(self):
-        query = "SELECT COUNT(*) FROM tweets_by_date"
-        result = self.session.execute(query)
-        return result.one().count
+        Number of tweets from the tweets counter, maintained by import_csv (rows new to
+        imported_files only) and post_tweet.
+        With estimated=True it is taken from the size estimates of tweets_by_id (one partition
+        per tweet), which Cassandra refreshes periodically and which cover the local node only.
+        """
+        if estimated:
+            rows = self.statements.execute("select_size_estimates", (self.keyspace, "tweets_by_id"))
+            return sum(row.partitions_count for row in rows)
+        row = self.statements.execute("select_table_count", ("tweets",)).one()
+        return row.row_count if row is not None else 0
 
+    def recount_tweets(self):
+        """
+        Set the tweets counter from a full count of tweets_by_date, for data loaded before the
+        counter existed. Scans the whole table.
+        """
+        count = self.statements.execute("count_tweets_by_date", execution_profile=PROFILE_BULK, timeout=None).one().count
+        self.statements.execute("increment_table_count", (count - self.get_tweet_count(), "tweets"))
+        return count
+
+    def backfill_tweets_by_word(self, page_size=5000, concurrency=100):
+        """
+        Write the tweets_by_word postings of every tweet of tweets_by_date, for tweets stored before
+        the word index existed. Scans the whole table, safe to repeat.
+        """
+        start_time = datetime.now()
+        statement = self.statements.bind("scan_tweets_by_date")
+        statement.fetch_size = page_size
+        result = self.session.execute(statement, execution_profile=PROFILE_BULK, timeout=None)
+        tweets = 0
+        postings = 0
+        while True:
+            rows = list(result.current_rows)
+            params = [(word, row.user_id, row.tweet_date, row.tweet_id) for row in rows for word in self._tokenize(row.content)]
+            execute_concurrent_with_args(self.session, self.statements.get("insert_word_posting"), params,
+                                         concurrency=concurrency, execution_profile=PROFILE_BULK)
+            tweets += len(rows)
+            postings += len(params)
+            print(f"Indexed the words of {tweets} tweets in time {round((datetime.now() - start_time).total_seconds(), 2)}")
+            if not result.has_more_pages:
+                break
+            result.fetch_next_page()
+        return {"tweets": tweets, "postings": postings}
+
+    def backfill_tweets_by_id(self, page_size=5000, concurrency=100):
+        """
+        Copy every tweet of tweets_by_date into tweets_by_id, for tweets stored before the timeline
+        caches referenced tweets_by_id. Tweets without a like counter get it seeded with their stored
+        likes, so run it before such tweets are liked. Scans the whole table, safe to repeat.
+        """
+        start_time = datetime.now()
+        statement = self.statements.bind("scan_tweets_by_date")
+        statement.fetch_size = page_size
+        result = self.session.execute(statement, execution_profile=PROFILE_BULK, timeout=None)
+        copied = 0
+        seeded = 0
+        while True:
+            rows = list(result.current_rows)
+            execute_concurrent_with_args(self.session, self.statements.get("insert_tweet_by_id"),
+                                         [(row.tweet_id, row.user_id, row.tweet_date, row.content, row.number_of_likes)
+                                          for row in rows], concurrency=concurrency, execution_profile=PROFILE_BULK)
+            liked = [row for row in rows if row.number_of_likes]
+            counts = execute_concurrent_with_args(self.session, self.statements.get("select_like_count"),
+                                                  [(row.tweet_id,) for row in liked], concurrency=concurrency,
+                                                  execution_profile=PROFILE_BULK)
+            unseeded = [row for row, (success, count) in zip(liked, counts) if count.one() is None]
+            self.increment_like_counts([(row.tweet_id, row.number_of_likes) for row in unseeded],
+                                       concurrency=concurrency, execution_profile=PROFILE_BULK)
+            copied += len(rows)
+            seeded += len(unseeded)
+            print(f"Copied {copied} tweets to tweets_by_id in time {round((datetime.now() - start_time).total_seconds(), 2)}")
+            if not result.has_more_pages:
+                break
+            result.fetch_next_page()
+        return {"tweets": copied, "seeded_like_counts": seeded}
 
     def clean_database(self, keyspace_name='tweets', tables=None):
         print("Cleaning database...")
@@ -197,10 +641,12 @@ class Tweet_DB:
             table_name = row.table_name
             drop_table_query = f"DROP TABLE IF EXISTS {keyspace_name}.{table_name};"
             try:
-                self.session.execute(drop_table_query)
+                self.session.execute(drop_table_query, execution_profile=PROFILE_BULK)
                 print(f"Dropped table {table_name}")
             except Exception as e:
                 print(f"Error dropping table {table_name}: {e}")
+        # the prepared statements refer to the dropped tables
+        self.statements.invalidate()
 
     def load_data(self, query, parameters=None):
         if parameters is None:
@@ -211,29 +657,22 @@ class Tweet_DB:
         """
         Create or update the user mapping table with the given user_id and username.
         """
-        # Create the user_mapping table if it does not exist
-        self.session.execute("""CREATE TABLE IF NOT EXISTS user_mapping (user_id int PRIMARY KEY, username text)""")
-
         # Check if the user_id already exists in the mapping table
-        check_query = "SELECT COUNT(*) FROM user_mapping WHERE user_id = %s"
-        result = self.session.execute(check_query, (user_id,))
+        result = self.statements.execute("count_user_mapping", (user_id,))
         count = result[0].count  # Access the count from the first (and only) row in the result set
         
         if count == 0:
             # If the user_id does not exist, insert a new record
-            insert_query = "INSERT INTO user_mapping (user_id, username) VALUES (%s, %s)"
-            self.session.execute(insert_query, (user_id, username))
+            self.statements.execute("insert_user_mapping", (user_id, username))
         else:
             # If the user_id exists, update the existing record (if you want to keep the table updated with the latest username)
-            update_query = "UPDATE user_mapping SET username = %s WHERE user_id = %s"
-            self.session.execute(update_query, (username, user_id))
+            self.statements.execute("update_user_mapping", (username, user_id))
 
     def get_username_from_user_id(self, user_id):
         """
         Retrieve the username for a given user_id from the user_mapping table.
         """
-        query = "SELECT username FROM user_mapping WHERE user_id = %s"
-        result = self.session.execute(query, (user_id,))
+        result = self.statements.execute("select_username", (user_id,))
         # if result is empty, return None
         if not result:
             return None
@@ -243,167 +682,425 @@ class Tweet_DB:
         """
         Retrieve the user_id for a given username from the user_mapping table.
         """
-        query = "SELECT user_id FROM user_mapping WHERE username = %s"
-        result = self.session.execute(query, (username,))
+        result = self.statements.execute("select_user_id", (username,))
         if not result:
             return None
         return result[0].user_id
 
-    def import_csv(self, csv_file, user_ids, limit=None):
+    def import_csv(self, csv_file, user_ids, limit=None, concurrency=100, chunk_size=10000, resume=False):
+        """
+        Stream the csv file in chunks of chunk_size rows, so memory stays bounded and the next chunk
+        is parsed while the current one is written. After every chunk the number of committed rows is
+        stored in import_checkpoints, with resume=True an interrupted import continues from there.
+        """
         print(f"Importing data from {csv_file}")
-        df = pd.read_csv(csv_file)
-        if limit:
-            df = df.iloc[:limit]
-
         user_ids_li = [int(user['user']) for user in user_ids]
-        user_ids_dict = {user_id: '' for user_id in user_ids_li}
+        # authors get the given user ids in order of their first appearance
+        author_ids = {}
+        committed_rows = 0
+        if resume:
+            checkpoint = self.statements.execute("select_import_checkpoint", (csv_file,)).one()
+            if checkpoint is not None:
+                committed_rows = checkpoint.committed_rows
+                author_ids = dict(checkpoint.author_ids or {})
+                print(f"Resuming import after {committed_rows} committed rows")
+        else:
+            self.statements.execute("delete_import_checkpoint", (csv_file,))
+        assigned_user_ids = set(author_ids.values())
+        free_user_ids = deque(user_id for user_id in user_ids_li if user_id not in assigned_user_ids)
+        imported = self.statements.execute("select_imported_rows", (csv_file,)).one()
+        imported_rows = imported.imported_rows if imported is not None else 0
 
-        row_count = len(df)
-        print(f"Inserting {row_count} rows into the database")
         start_time = datetime.now()
-        for idx, row in df.iterrows():
-            tweet_date = datetime.strptime(row['date_time'], '%d/%m/%Y %H:%M')
-            #tweet_id = uuid_from_time(tweet_date)  # Generate UUID based on tweet_date
-            # = (row['user_id'], row['number_of_likes'], tweet_id, row['tweet_date'], row['content']) if table_type == 'likes' else (row['user_id'], tweet_id, row['tweet_date'], row['content'], row['number_of_likes'])
-            
-            #self.session.execute(insert_query, values)
-
-            if idx % 1000 == 0:
-                end_time = datetime.now()
-                time_diff = (end_time - start_time).total_seconds()
-                print(f"Inserted {idx}/{row_count} rows in time {round(time_diff, 2)}")
-                start_time = datetime.now()
-
-            # check if user name is in user_ids_dict values
-            if row['author'] in user_ids_dict.values():
-                # get the key where the value is equal to the row['author']
-                user_id = [key for key, value in user_ids_dict.items() if value == row['author']][0]
-            else:
-                # get a key where the value is ''
-                user_id = [key for key, value in user_ids_dict.items() if value == ''][0]
-                user_ids_dict[user_id] = row['author']
-
-            tweet_id = uuid.uuid4()
-            # write to tweets table by likes
-            insert_query = """
-                        INSERT INTO tweets_by_likes (user_id, number_of_likes, tweet_id, tweet_date, content)
-                        VALUES (%s, %s, %s, %s, %s)
-                        """
-            values = (user_id, row['number_of_likes'], tweet_id,  tweet_date, row['content'])
-            self.session.execute(insert_query, values)
-            # write to tweets table by date
-            insert_query = """
-                            INSERT INTO tweets_by_date (user_id, tweet_id, tweet_date, content, number_of_likes)
-                            VALUES (%s, %s, %s, %s, %s)
-                            """
-            values = (user_id, tweet_id, tweet_date, row['content'], row['number_of_likes'])
-            self.session.execute(insert_query, values)
+        start_rows = committed_rows
+        for chunk in self._read_csv_chunks(csv_file, chunk_size, skip_rows=committed_rows, limit=limit):
+            self._insert_tweet_chunk(chunk, committed_rows, csv_file, author_ids, free_user_ids, concurrency,
+                                     new_from_row=imported_rows)
+            # only rows beyond the earlier imports of the file are new tweets
+            new_rows = max(0, committed_rows + len(chunk) - max(committed_rows, imported_rows))
+            if new_rows:
+                self.statements.execute("increment_table_count", (new_rows, "tweets"))
+            committed_rows += len(chunk)
+            imported_rows = max(imported_rows, committed_rows)
+            # stored together, a crash before this batch counts the chunk again
+            batch = BatchStatement(batch_type=BatchType.LOGGED)
+            batch.add(self.statements.get("upsert_imported_rows"), (csv_file, imported_rows))
+            batch.add(self.statements.get("upsert_import_checkpoint"), (csv_file, committed_rows, author_ids))
+            self.session.execute(batch)
+            time_diff = (datetime.now() - start_time).total_seconds()
+            rows_per_sec = (committed_rows - start_rows) / max(time_diff, 1e-9)
+            print(f"Inserted {committed_rows} rows in time {round(time_diff, 2)} ({round(rows_per_sec)} rows/sec)")
 
+        user_ids_dict = {user_id: '' for user_id in user_ids_li}
+        user_ids_dict.update({user_id: author for author, user_id in author_ids.items()})
         for user_id, user_name in user_ids_dict.items():
             self.create_or_update_user_mapping(user_id, user_name)
+        self.statements.execute("delete_import_checkpoint", (csv_file,))
 
+    @staticmethod
+    def _read_csv_chunks(csv_file, chunk_size, skip_rows=0, limit=None, prefetch=2):
+        # a reader thread parses ahead into a bounded queue while the caller writes
+        chunks = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
 
-    def get_tweets_by_user_ids(self, user_ids, n, filter_words=None, by_likes=False):
-        tweets = []
-        table_name = "tweets_by_likes" if by_likes else "tweets_by_date"
-        for user_id in user_ids:
-            query = f"""
-                SELECT user_id, tweet_id, tweet_date, content, number_of_likes
-                FROM {table_name}
-                WHERE user_id = %s
-                LIMIT %s
-            """
-            results = self.session.execute(query, (user_id, n))
-            for row in results:
+        def put(item):
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read_chunks():
+            try:
+                remaining = None if limit is None else max(limit - skip_rows, 0)
+                # skip the committed data rows but keep the header
+                reader = pd.read_csv(csv_file, chunksize=chunk_size, skiprows=range(1, skip_rows + 1))
+                for chunk in reader:
+                    if remaining is not None:
+                        if remaining == 0:
+                            break
+                        chunk = chunk.iloc[:remaining]
+                        remaining -= len(chunk)
+                    if not put(chunk):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(None)
+
+        reader_thread = threading.Thread(target=read_chunks, daemon=True)
+        reader_thread.start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _map_authors(authors, author_ids, free_user_ids):
+        # factorize, so only the distinct authors of the chunk are looked up
+        codes, uniques = pd.factorize(authors)
+        unique_user_ids = np.empty(len(uniques), dtype=np.int64)
+        for idx, author in enumerate(uniques):
+            if author not in author_ids:
+                if not free_user_ids:
+                    raise ValueError("The csv file contains more authors than user ids were given")
+                author_ids[author] = free_user_ids.popleft()
+            unique_user_ids[idx] = author_ids[author]
+        return unique_user_ids[codes]
+
+    def _insert_tweet_chunk(self, chunk, first_row, csv_file, author_ids, free_user_ids, concurrency, new_from_row=0):
+        tweet_dates = pd.to_datetime(chunk['date_time'], format='%d/%m/%Y %H:%M').dt.to_pydatetime()
+        user_ids = self._map_authors(chunk['author'], author_ids, free_user_ids).tolist()
+        likes = chunk['number_of_likes'].astype(np.int64).tolist()
+        contents = chunk['content'].tolist()
+        # ids derived from the row number, so rows written again after a resume are overwritten, not duplicated;
+        # version 4 like posted tweets, Cassandra orders uuids by version first and Python by bytes only
+        tweet_ids = [uuid.UUID(bytes=hashlib.md5(f"{csv_file}#{row}".encode()).digest(), version=4)
+                     for row in range(first_row, first_row + len(chunk))]
+
+        insert_by_likes = self.statements.get("insert_tweet_by_likes")
+        insert_by_date = self.statements.get("insert_tweet_by_date")
+        insert_by_id = self.statements.get("insert_tweet_by_id")
+        insert_posting = self.statements.get("insert_word_posting")
+        increment_likes = self.statements.get("increment_like_count")
+        statements_and_params = []
+        rows = range(first_row, first_row + len(chunk))
+        for row, user_id, number_of_likes, tweet_id, tweet_date, content in zip(rows, user_ids, likes, tweet_ids, tweet_dates, contents):
+            # write to tweets table by likes and by date
+            statements_and_params.append((insert_by_likes, (user_id, number_of_likes, tweet_id, tweet_date, content)))
+            statements_and_params.append((insert_by_date, (user_id, tweet_id, tweet_date, content, number_of_likes)))
+            statements_and_params.append((insert_by_id, (tweet_id, user_id, tweet_date, content, number_of_likes)))
+            # the like counter starts at the imported likes, later likes are added to it;
+            # rows written by an earlier import of the file already have their counter
+            if number_of_likes and row >= new_from_row:
+                statements_and_params.append((increment_likes, (number_of_likes, tweet_id)))
+            # and to the word index
+            for word in self._tokenize(content):
+                statements_and_params.append((insert_posting, (word, user_id, tweet_date, tweet_id)))
+        execute_concurrent(self.session, statements_and_params, concurrency=concurrency, execution_profile=PROFILE_BULK)
+
+    @staticmethod
+    def _tokenize(text):
+        if not isinstance(text, str):
+            return []
+        return sorted(set(re.findall(r"\w+", text.lower())))
+
+    def get_tweets_by_user_ids(self, user_ids, n, filter_words=None, by_likes=False, concurrency=50, use_word_index=True,
+                               after=None, max_candidates=1000):
+        """
+        The top n tweets of the users, by date or by likes. after is the decoded keyset cursor
+        (tweet_date or number_of_likes, tweet_id) of the previous page, every partition is read
+        from there on, so a page costs the same at any depth.
+        filter_words are answered from the word index, see _get_tweets_by_words, unless use_word_index is False.
+        """
+        if filter_words and use_word_index:
+            tweets = self._get_tweets_by_words(user_ids, n, filter_words, by_likes=by_likes, concurrency=concurrency,
+                                               after=after, max_candidates=max_candidates)
+            if tweets is not None:
+                return tweets
+        if after is None:
+            statement = self.statements.get("select_tweets_by_likes" if by_likes else "select_tweets_by_date")
+            params = [(user_id, n) for user_id in user_ids]
+        else:
+            statement = self.statements.get("select_tweets_by_likes_after" if by_likes else "select_tweets_by_date_after")
+            params = [(user_id, after[0], after[1], n) for user_id in user_ids]
+        # one query per partition, at most concurrency of them in flight
+        results = execute_concurrent_with_args(self.session, statement, params, concurrency=concurrency)
+
+        # Determine the sorting key based on the query type
+        if by_likes:
+            sort_key = lambda x: (x.number_of_likes, x.tweet_id)
+        else:
+            sort_key = lambda x: (x.tweet_date, x.tweet_id)
+
+        def partition_stream(rows):
+            for row in rows:
                 if filter_words:
                     tweet_text = row.content.lower()
                     if all(word.lower() in tweet_text for word in filter_words):
-                        tweets.append(row)
+                        yield row
                 else:
-                    tweets.append(row)
+                    yield row
 
-        # Determine the sorting key based on the query type
+        # every partition is already sorted by the clustering order, so a k-way merge
+        # in descending order yields the top n tweets without sorting all of them
+        streams = [partition_stream(result) for success, result in results]
+        return list(islice(heapq.merge(*streams, key=sort_key, reverse=True), n))
+
+    def _get_tweets_by_words(self, user_ids, n, filter_words, by_likes=False, concurrency=50, after=None,
+                             max_candidates=1000):
+        """
+        Answer a filter_words query from the tweets_by_word index: the posting lists of all words
+        are intersected per user, and only the matching tweets are read from tweets_by_date.
+        Words match whole tokens of the tweet, case insensitive. Every posting list is read with
+        LIMIT max_candidates + 1. Returns None if the words are not selective, i.e. a posting list is
+        longer than max_candidates or, by likes, more than max_candidates tweets match. The caller
+        then filters the newest tweets of every partition instead.
+        """
+        words = sorted({token for word in filter_words for token in self._tokenize(word)})
+        if not words:
+            return self.get_tweets_by_user_ids(user_ids, n, by_likes=by_likes, concurrency=concurrency, after=after)
+
+        user_ids = list(dict.fromkeys(user_ids))
+        word_user_pairs = [(word, user_id) for user_id in user_ids for word in words]
+        if after is not None and not by_likes:
+            # only the postings older than the cursor can match
+            results = execute_concurrent_with_args(self.session, self.statements.get("select_word_postings_after"),
+                                                   [pair + after + (max_candidates + 1,) for pair in word_user_pairs],
+                                                   concurrency=concurrency)
+        else:
+            results = execute_concurrent_with_args(self.session, self.statements.get("select_word_postings"),
+                                                   [pair + (max_candidates + 1,) for pair in word_user_pairs],
+                                                   concurrency=concurrency)
+        # intersect the postings of all words per user
+        matches = {}
+        for (word, user_id), (success, rows) in zip(word_user_pairs, results):
+            postings = {(row.tweet_date, row.tweet_id) for row in rows}
+            if len(postings) > max_candidates:
+                # a truncated posting list would drop matches from the intersection
+                return None
+            matches[user_id] = postings if user_id not in matches else matches[user_id] & postings
+        candidates = [(user_id, tweet_date, tweet_id) for user_id, postings in matches.items()
+                      for tweet_date, tweet_id in postings]
+        if by_likes and len(candidates) > max_candidates:
+            # every candidate would be one point read
+            return None
+        if not by_likes:
+            # the postings already carry the date, only the newest n have to be read
+            candidates = heapq.nlargest(n, candidates, key=lambda c: (c[1], c[2]))
+
+        results = execute_concurrent_with_args(self.session, self.statements.get("select_tweet_by_key"),
+                                               candidates, concurrency=concurrency)
+        tweets = [row for success, rows in results for row in rows]
         if by_likes:
             sort_key = lambda x: (x.number_of_likes, x.tweet_id)
+            if after is not None:
+                tweets = [tweet for tweet in tweets if sort_key(tweet) < after]
         else:
             sort_key = lambda x: (x.tweet_date, x.tweet_id)
+        return heapq.nlargest(n, tweets, key=sort_key)
 
-        # Sort the tweets based on the determined sort key in descending order
-        tweets.sort(key=sort_key, reverse=True)
+    def update_cache(self, user_id, tweets):
+        # write only, the cap is enforced by the TTL and the background trimmer
+        for tweet in tweets:
+            values = (user_id, tweet.tweet_id, tweet.tweet_date, tweet.user_id, self.cache_ttl)
+            self.statements.execute("insert_cache", values)
+        self.mark_caches_dirty([user_id])
 
-        # Return the top n tweets
-        return tweets[:n]
+    def mark_caches_dirty(self, user_ids):
+        with self._dirty_lock:
+            self._dirty_caches.update(int(user_id) for user_id in user_ids)
 
-    def update_cache(self, user_id, tweets, n=25, new_tweet=False):
-        for tweet in tweets:
-            insert_query = """
-                INSERT INTO tweets_cache (follower_id, tweet_id, tweet_date, content, number_of_likes)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            if new_tweet:
-                values = (user_id, tweet['tweet_id'], tweet['tweet_date'], tweet['content'], tweet['number_of_likes'])
-            else:
-                values = (user_id, tweet.tweet_id, tweet.tweet_date, tweet.content, tweet.number_of_likes)
-            self.session.execute(insert_query, values)
-        # Get the current number of tweets in the cache
-        query = "SELECT COUNT(*) FROM tweets_cache WHERE follower_id = %s"
-        result = self.session.execute(query, (user_id,))
-        count = result.one().count
-        
-        # If the cache has more than n tweets, remove the oldest tweets
-        if count > n:
+    def trim_dirty_caches(self, concurrency=50):
+        with self._dirty_lock:
+            user_ids, self._dirty_caches = self._dirty_caches, set()
+        if not user_ids:
+            return 0
+        n = self.cache_size
+        user_ids = list(user_ids)
+        # the dates of all dirty caches are read first, then the full ones are trimmed, both with bounded concurrency
+        results = execute_concurrent_with_args(self.session, self.statements.get("select_cache_dates"),
+                                               [(user_id, n + 1) for user_id in user_ids], concurrency=concurrency,
+                                               raise_on_first_error=False, execution_profile=PROFILE_FANOUT)
+        deletes = []
+        for user_id, (success, result) in zip(user_ids, results):
+            if not success:
+                # trimmed with the next pass
+                self.mark_caches_dirty([user_id])
+                continue
+            oldest_kept = self._oldest_kept_date([row.tweet_date for row in result], n)
+            if oldest_kept is not None:
+                deletes.append((user_id, oldest_kept))
+        results = execute_concurrent_with_args(self.session, self.statements.get("delete_cache_older"), deletes,
+                                               concurrency=concurrency, raise_on_first_error=False,
+                                               execution_profile=PROFILE_FANOUT)
+        self.mark_caches_dirty([user_id for (user_id, _), (success, _) in zip(deletes, results) if not success])
+        return len(user_ids)
 
-            query = f"""
-                SELECT tweet_date FROM tweets_cache WHERE follower_id = %s
-                ORDER BY tweet_date DESC
-            """
-            # DESC LIMIT {n} previous it was ASC
-            result = self.session.execute(query, (user_id,))
-            tweet_dates = [row.tweet_date for row in result]
-            oldest_tweet_date = tweet_dates[n-1]
-            # Delete all tweets older than the nth oldest tweet
-            query = f"""
-                DELETE FROM tweets_cache WHERE follower_id = %s AND tweet_date <= %s
-            """
-            self.session.execute(query, (user_id, oldest_tweet_date))
+    def trim_cache(self, user_id, n=None):
+        n = n or self.cache_size
+        # only the dates of the newest n + 1 tweets are read, the partition is never counted
+        result = self.statements.execute("select_cache_dates", (user_id, n + 1))
+        oldest_kept = self._oldest_kept_date([row.tweet_date for row in result], n)
+        if oldest_kept is not None:
+            # Delete all tweets older than the nth newest tweet, as one range tombstone
+            self.statements.execute("delete_cache_older", (user_id, oldest_kept))
+
+    @staticmethod
+    def _oldest_kept_date(tweet_dates, n):
+        # the date to delete below, None if nothing is older than the nth newest tweet,
+        # so a cache holding exactly n tweets gets no tombstone
+        if len(tweet_dates) <= n or tweet_dates[n] >= tweet_dates[n - 1]:
+            return None
+        return tweet_dates[n - 1]
+
+    def start_cache_trimmer(self, interval=60):
+        def trim_loop():
+            while not self._trim_stop.wait(interval):
+                try:
+                    self.trim_dirty_caches()
+                except Exception as e:
+                    print(f"Error trimming the caches: {e}")
+
+        if self._trim_thread is None:
+            self._trim_stop.clear()
+            self._trim_thread = threading.Thread(target=trim_loop, daemon=True)
+            self._trim_thread.start()
     
-    def get_tweets_from_cache(self, user_id, n=25):
-        query = "SELECT * FROM tweets_cache WHERE follower_id = %s LIMIT %s"
-        result = self.session.execute(query, (user_id, n))
-        # result to list
-        result = list(result)
-        return result
-        
+    def get_tweets_from_cache(self, user_id, n=25, pull_author_ids=None, concurrency=50, after=None):
+        """
+        Return the newest n tweets of the user's timeline, older than the keyset cursor after
+        (tweet_date, tweet_id) if given. The cache holds references, which are hydrated from
+        tweets_by_id. The tweets of pull_author_ids, the followed authors above fanout_threshold,
+        are not in the cache and are merged in from tweets_by_date.
+        """
+        # the partition may hold more than n tweets until the next trim, LIMIT keeps the newest n
+        if after is None:
+            references = list(self.statements.execute("select_cache", (user_id, n)))
+        else:
+            references = list(self.statements.execute("select_cache_after", (user_id, after[0], after[1], n)))
+        bodies = self._get_tweet_bodies([ref.tweet_id for ref in references], concurrency=concurrency)
+        # references whose tweet is gone are skipped
+        result = [CacheRow(user_id, ref.tweet_date, ref.tweet_id, bodies[ref.tweet_id].content,
+                           bodies[ref.tweet_id].number_of_likes, ref.author_id)
+                  for ref in references if ref.tweet_id in bodies]
+        with self._timeline_lock:
+            self.timeline_stats["timeline_reads"] += 1
+            self.timeline_stats["pulled_author_reads"] += len(pull_author_ids or [])
+        if not pull_author_ids:
+            return result
 
-    def post_tweet(self, user_id, tweet_text, user_followers):
+        pulled = [CacheRow(user_id, row.tweet_date, row.tweet_id, row.content, row.number_of_likes, row.user_id)
+                  for row in self.get_tweets_by_user_ids(pull_author_ids, n, after=after)]
+        # both lists are sorted newest first, tweets cached by an initial update_cache are skipped once
+        sort_key = lambda x: (x.tweet_date, x.tweet_id)
+        seen = set()
+        merged = (row for row in heapq.merge(result, pulled, key=sort_key, reverse=True)
+                  if not (row.tweet_id in seen or seen.add(row.tweet_id)))
+        return list(islice(merged, n))
+
+    def _get_tweet_bodies(self, tweet_ids, concurrency=50):
+        # hot tweets come from the LRU, the rest is read from tweets_by_id concurrently
+        bodies = {}
+        with self._body_cache_lock:
+            for tweet_id in tweet_ids:
+                if tweet_id in self.tweet_body_cache:
+                    self.tweet_body_cache.move_to_end(tweet_id)
+                    bodies[tweet_id] = self.tweet_body_cache[tweet_id]
+        missing = [tweet_id for tweet_id in dict.fromkeys(tweet_ids) if tweet_id not in bodies]
+        if not missing:
+            return bodies
+        results = execute_concurrent_with_args(self.session, self.statements.get("select_tweet_by_id"),
+                                               [(tweet_id,) for tweet_id in missing], concurrency=concurrency)
+        fetched = {row.tweet_id: row for success, rows in results for row in rows}
+        bodies.update(fetched)
+        if self.tweet_body_cache_size:
+            with self._body_cache_lock:
+                self.tweet_body_cache.update(fetched)
+                while len(self.tweet_body_cache) > self.tweet_body_cache_size:
+                    self.tweet_body_cache.popitem(last=False)
+        return bodies
+
+    def is_pulled_author(self, follower_count):
+        return self.fanout_threshold is not None and follower_count > self.fanout_threshold
+
+    def post_tweet(self, user_id, tweet_text, user_followers, followers_count=None):
+        """
+        followers_count decides whether the author is pulled instead of fanned out. Pass the stored
+        followersCount of the graph, which the readers select the pulled authors by, so both sides agree
+        even if the counters are stale. Without it the number of user_followers is used.
+        """
+        if followers_count is None:
+            followers_count = len(user_followers)
         tweet_id = uuid.uuid4()
         tweet_date = datetime.now()
         tweet = {
+            'user_id': user_id,
             'tweet_id': tweet_id, 
             'tweet_date': tweet_date, 
             'content': tweet_text,
              'number_of_likes': 0
         }
         # write to tweets table by date
-        insert_query = """
-            INSERT INTO tweets_by_date (user_id, tweet_id, tweet_date, content, number_of_likes)
-            VALUES (%s, %s, %s, %s, 0)
-        """
-        values = (user_id, tweet_id, tweet_date, tweet_text)
-        self.session.execute(insert_query, values)
+        values = (user_id, tweet_id, tweet_date, tweet_text, 0)
+        self.statements.execute("insert_tweet_by_date", values)
         # write to tweets table by likes
-        insert_query = """
-            INSERT INTO tweets_by_likes (user_id, number_of_likes, tweet_id, tweet_date, content)
-            VALUES (%s, 0, %s, %s, %s)
-        """
-        values = (user_id, tweet_id, tweet_date, tweet_text)
-        self.session.execute(insert_query, values)
-        # insert into cache in fan out style
-        for follows_id in user_followers:
-            self.update_cache(int(follows_id), [tweet], new_tweet=True)
+        values = (user_id, 0, tweet_id, tweet_date, tweet_text)
+        self.statements.execute("insert_tweet_by_likes", values)
+        # write the row the timeline caches refer to, a missing like counter counts as 0 likes,
+        # so a new tweet needs no counter seed
+        self.statements.execute("insert_tweet_by_id", (tweet_id, user_id, tweet_date, tweet_text, 0))
+        self.statements.execute("increment_table_count", (1, "tweets"))
+        # write to the word index, all postings in flight at once
+        execute_concurrent_with_args(self.session, self.statements.get("insert_word_posting"),
+                                     [(word, user_id, tweet_date, tweet_id) for word in self._tokenize(tweet_text)])
+        # authors with many followers are pulled at read time instead of being fanned out
+        if self.is_pulled_author(followers_count):
+            with self._timeline_lock:
+                self.timeline_stats["posts_pulled"] += 1
+                self.timeline_stats["cache_writes_saved"] += len(user_followers)
+            return tweet
+        # insert into cache in fan out style, the post returns once the tweet itself is written
+        with self._timeline_lock:
+            self.timeline_stats["posts_pushed"] += 1
+            self.timeline_stats["cache_writes"] += len(user_followers)
+        self.fanout.submit(tweet, user_followers)
+        return tweet
 
 
     def close(self):
+        self._trim_stop.set()
+        # the queued fan-outs and likes are written before the cluster is shut down
+        self.fanout.close()
+        self.likes.close()
         self.cluster.shutdown()
 
 
@@ -422,7 +1119,7 @@ if __name__ == "__main__":
     user_nodes = requests.get("http://127.0.0.1:5000/users/with_most_followers", params={"limit": f"{MAX_USERS}"})
     
     tweet_db.clean_database()
-    # tweet_db.setup_all_tables()
+    tweet_db.setup_all_tables()
 
     data_path = "api_service/data/tweets.csv"
     tweet_db.import_csv(data_path, user_nodes.json(), limit=None)
@@ -515,11 +1212,9 @@ if __name__ == "__main__":
     row = result.one()
     # get the tweet data
     tweet_id = row.tweet_id
-    number_of_likes = row.number_of_likes
     tweet_date = row.tweet_date
-    content = row.content
     # like the tweet
-    tweet_db.like_tweet(user_id, follower_id, tweet_id, number_of_likes, tweet_date, content)
+    tweet_db.like_tweet(user_id, follower_id, tweet_id, tweet_date)
 
     print('-' * 100)
     print('Print the cached from the user who follows the user')
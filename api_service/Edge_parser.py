@@ -0,0 +1,106 @@
+import mmap
+import os
+import numpy as np
+import time as time
+
+
+class EdgeListParser:
+    """
+    Parser for whitespace separated edge lists like twitter_combined.txt ("follower followed" per line).
+    The file is memory-mapped and decoded chunk by chunk into int64 NumPy arrays.
+    """
+    def __init__(self, txt_file, chunk_size=64 * 1024 * 1024):
+        self.txt_file = txt_file
+        self.chunk_size = chunk_size
+
+    def _iter_raw_chunks(self):
+        # yields byte chunks that always end on a line break, so no line is split between chunks
+        if os.path.getsize(self.txt_file) == 0:
+            return
+        with open(self.txt_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = min(start + self.chunk_size, size)
+                if end < size:
+                    line_end = mm.rfind(b"\n", start, end)
+                    # a single line longer than chunk_size, extend to the next line break
+                    end = line_end + 1 if line_end != -1 else (mm.find(b"\n", end) + 1 or size)
+                yield mm[start:end]
+                start = end
+
+    def iter_chunks(self, limit=None):
+        """
+        Yield (followers, followed) int64 array pairs per chunk, stopping after limit edges.
+        """
+        remaining = limit
+        for chunk in self._iter_raw_chunks():
+            values = np.fromstring(chunk.decode("ascii"), dtype=np.int64, sep=" ")
+            # fromstring ignores line breaks, a line with one or three ids would be paired with its neighbours
+            self._check_lines(chunk, values.size)
+            pairs = values.reshape(-1, 2)
+            if remaining is not None:
+                pairs = pairs[:remaining]
+                remaining -= len(pairs)
+            yield pairs[:, 0], pairs[:, 1]
+            if remaining is not None and remaining <= 0:
+                break
+
+    def _check_lines(self, chunk, parsed):
+        # counts the ids of every line on the raw bytes, blank lines are fine, every other line needs two.
+        # Bytes up to the space are separators, like the whitespace fromstring skips.
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        line_breaks = np.flatnonzero(data == ord("\n"))
+        starts = data > 32
+        starts[1:] &= data[:-1] <= 32
+        starts = np.flatnonzero(starts)
+        # line number of every id, from the positions of the line breaks
+        line_of_id = np.searchsorted(line_breaks, starts, side="right")
+        del line_breaks, starts
+        ids_per_line = np.bincount(line_of_id)
+        bad_lines = np.flatnonzero((ids_per_line != 0) & (ids_per_line != 2))
+        if bad_lines.size:
+            line = chunk.split(b"\n")[bad_lines[0]]
+            raise ValueError(f"Malformed edge list in {self.txt_file}: line {line[:100]!r} is not a pair of ids")
+        if parsed != line_of_id.size:
+            raise ValueError(f"Malformed edge list in {self.txt_file}: chunk contains ids that are not integers")
+
+    def read_arrays(self, limit=None):
+        """
+        Return the whole edge list as two int64 arrays (followers, followed).
+        """
+        start_time = time.time()
+        followers = []
+        followed = []
+        for chunk_followers, chunk_followed in self.iter_chunks(limit=limit):
+            followers.append(chunk_followers)
+            followed.append(chunk_followed)
+        if not followers:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        followers = np.concatenate(followers)
+        followed = np.concatenate(followed)
+        print(f"Parsed {len(followers)} edges from {self.txt_file} in time: {round(time.time() - start_time, 2)} seconds.")
+        return followers, followed
+
+    def count_lines(self):
+        """
+        Count the lines of the file without decoding it.
+        """
+        count = 0
+        last_byte = b"\n"
+        for chunk in self._iter_raw_chunks():
+            count += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+        # the last line has no trailing line break
+        if last_byte != b"\n":
+            count += 1
+        return count
+
+    def unique_users(self, limit=None):
+        """
+        Return the sorted distinct user ids occurring on either side of an edge.
+        """
+        users = np.empty(0, dtype=np.int64)
+        for chunk_followers, chunk_followed in self.iter_chunks(limit=limit):
+            users = np.union1d(users, np.union1d(chunk_followers, chunk_followed))
+        return users
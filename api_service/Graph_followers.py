@@ -1,35 +1,191 @@
 from neo4j import GraphDatabase
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
+import numpy as np
+from Edge_parser import EdgeListParser
+from Graph_leaderboard import TopKLeaderboard
+import Graph_queries as queries
+import random
 import time as time
 
 class TwitterGraph:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri, user, password, max_connection_pool_size=100, connection_acquisition_timeout=60.0):
+        self.driver = GraphDatabase.driver(uri, auth=(user, password),
+                                           max_connection_pool_size=max_connection_pool_size,
+                                           connection_acquisition_timeout=connection_acquisition_timeout)
+        # optional in-process FollowGraphSnapshot serving follower lookups, see Graph_snapshot.py
+        self.snapshot = None
+        # TopKLeaderboard of the most followed users, loaded on first use
+        self.leaderboard = None
+        self.leaderboard_capacity = 1000
+        # results of find_users_which_follow_most, cleared on every follow graph write
+        self.follow_most_cache = OrderedDict()
+        self.follow_most_cache_size = 128
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+
+    def setup_schema(self):
+        # unique User.id, so MERGE and MATCH on the id use an index seek instead of a label scan
+        with self.driver.session() as session:
+            session.run(
+                "CREATE CONSTRAINT user_id_unique IF NOT EXISTS "
+                "FOR (u:User) REQUIRE u.id IS UNIQUE"
+            ).consume()
+            # index backed ORDER BY for the most followed users
+            session.run(
+                "CREATE INDEX user_followers_count IF NOT EXISTS "
+                "FOR (u:User) ON (u.followersCount)"
+            ).consume()
+
+    def migrate_string_ids(self, batch_size=10000):
+        """
+        Convert User.id values stored as strings by earlier imports into integers.
+        A string node whose integer twin already exists is merged into the twin, non-numeric ids are left as they are.
+        The follow counts are stale afterwards, run recompute_follow_counts.
+        """
+        numeric = "u.id = toString(u.id) AND u.id =~ '-?[0-9]+' "
+        # moves the relationships of the string node to its integer twin, a self follow stays one
+        merge_query = (
+            f"MATCH (u:User) WHERE {numeric}"
+            "MATCH (twin:User {id: toInteger(u.id)}) "
+            "WITH u, twin LIMIT $batch_size "
+            "CALL { WITH u, twin MATCH (u)-[:FOLLOWS]->(b:User) "
+            "WITH twin, CASE WHEN b = u THEN twin ELSE b END AS b MERGE (twin)-[:FOLLOWS]->(b) } "
+            "CALL { WITH u, twin MATCH (a:User)-[:FOLLOWS]->(u) WHERE a <> u MERGE (a)-[:FOLLOWS]->(twin) } "
+            "DETACH DELETE u "
+            "RETURN count(*) AS merged"
+        )
+        # one node per integer id, ids like "007" and "7" converge through the merge on the next pass
+        convert_query = (
+            f"MATCH (u:User) WHERE {numeric}"
+            "AND NOT EXISTS { MATCH (:User {id: toInteger(u.id)}) } "
+            "WITH toInteger(u.id) AS id, head(collect(u)) AS u LIMIT $batch_size "
+            "SET u.id = id "
+            "RETURN count(u) AS migrated"
+        )
+        non_numeric_query = (
+            "MATCH (u:User) WHERE u.id = toString(u.id) AND NOT u.id =~ '-?[0-9]+' "
+            "RETURN count(u) AS nonNumeric"
+        )
+
+        def run_batches(session, query, key):
+            total = 0
+            while True:
+                count = session.execute_write(lambda tx: tx.run(query, batch_size=batch_size).single()[key])
+                if count == 0:
+                    return total
+                total += count
+
+        total_migrated = 0
+        total_merged = 0
+        with self.driver.session() as session:
+            while True:
+                total_merged += run_batches(session, merge_query, "merged")
+                migrated = session.execute_write(lambda tx: tx.run(convert_query, batch_size=batch_size).single()["migrated"])
+                if migrated == 0:
+                    break
+                total_migrated += migrated
+                print(f"Migrated {total_migrated} user ids to integers, merged {total_merged} duplicate users.")
+            non_numeric = session.execute_read(lambda tx: tx.run(non_numeric_query).single()["nonNumeric"])
+        if non_numeric:
+            print(f"{non_numeric} users have non-numeric string ids and were not migrated.")
+        # merged users moved their relationships
+        self._refresh_snapshot()
+        return {"migrated": total_migrated, "merged": total_merged, "non_numeric": non_numeric}
+
+    def recompute_follow_counts(self, batch_size=10000):
+        """
+        Set the followersCount/followsCount properties of every user from its relationships.
+        Used after bulk loads and for graphs imported before the counters existed.
+        """
+        query = (
+            "MATCH (u:User) "
+            "CALL { WITH u "
+            "SET u.followersCount = COUNT { (u)<-[:FOLLOWS]-() }, "
+            "u.followsCount = COUNT { (u)-[:FOLLOWS]->() } "
+            f"}} IN TRANSACTIONS OF {int(batch_size)} ROWS"
+        )
+        start_time = time.time()
+        with self.driver.session() as session:
+            session.run(query).consume()
+        self.leaderboard = None
+        print(f"Recomputed follow counts in time: {round(time.time() - start_time, 2)} seconds.")
 
     def close(self):
         self.driver.close()
     
     def get_user_count(self):
+        # a label count without predicates is answered from the neo4j count store, not by a scan
         with self.driver.session() as session:
-            result = session.run("MATCH (u:User) RETURN COUNT(u) AS userCount")
+            result = session.run(queries.USER_COUNT)
+            return result.single()[0]
+
+    def get_follows_count(self):
+        # also answered from the count store
+        with self.driver.session() as session:
+            result = session.run("MATCH ()-[r:FOLLOWS]->() RETURN COUNT(r) AS followsCount")
             return result.single()[0]
 
     def create_follows_relationship(self, follower, followed):
         with self.driver.session() as session:
-            session.execute_write(self._create_and_link, follower, followed)
+            followers_count = session.execute_write(self._create_and_link, int(follower), int(followed))
+        self._invalidate_follow_most_cache()
+        # null if the edge existed on a user loaded before the counters, it is ranked after recompute_follow_counts
+        if self.leaderboard is not None and followers_count is not None:
+            self.leaderboard.update(int(followed), followers_count)
+        if self.snapshot is not None:
+            self.snapshot.add_edge(follower, followed)
 
     @staticmethod
     def _create_and_link(tx, follower, followed):
         query = (
             "MERGE (a:User {id: $follower}) "
             "MERGE (b:User {id: $followed}) "
+            "MERGE (a)-[:FOLLOWS]->(b) "
+            "ON CREATE SET a.followsCount = coalesce(a.followsCount, 0) + 1, "
+            "b.followersCount = coalesce(b.followersCount, 0) + 1 "
+            "RETURN b.followersCount AS followersCount"
+        )
+        return tx.run(query, follower=follower, followed=followed).single()["followersCount"]
+
+    @staticmethod
+    def _create_and_link_batch(tx, rows):
+        query = (
+            "UNWIND $rows AS row "
+            "MERGE (a:User {id: row.follower}) "
+            "MERGE (b:User {id: row.followed}) "
+            "MERGE (a)-[:FOLLOWS]->(b) "
+            "ON CREATE SET a.followsCount = coalesce(a.followsCount, 0) + 1, "
+            "b.followersCount = coalesce(b.followersCount, 0) + 1"
+        )
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _create_users_batch(tx, user_ids):
+        query = (
+            "UNWIND $user_ids AS user_id "
+            "MERGE (:User {id: user_id})"
+        )
+        tx.run(query, user_ids=user_ids)
+
+    @staticmethod
+    def _link_existing_batch(tx, rows):
+        # nodes are created beforehand, so only the relationship is merged here
+        query = (
+            "UNWIND $rows AS row "
+            "MATCH (a:User {id: row.follower}) "
+            "MATCH (b:User {id: row.followed}) "
             "MERGE (a)-[:FOLLOWS]->(b)"
         )
-        tx.run(query, follower=follower, followed=followed)
+        tx.run(query, rows=rows)
 
     def clean_database(self):
         print("Cleaning database...")
         with self.driver.session() as session:
             session.execute_write(self._delete_all)
+        self.leaderboard = None
+        self._invalidate_follow_most_cache()
 
     @staticmethod
     def _delete_all(tx):
@@ -40,8 +196,9 @@ class TwitterGraph:
         try:
             with open(txt_file, "r") as file:
                 # print how many lines exist in the file
-                total_lines = 2420766 #len(file.readlines())
-                #print(f"Total lines in file: {total_lines}")
+                total_lines = EdgeListParser(txt_file).count_lines()
+                if limit is not None:
+                    total_lines = min(total_lines, limit)
                 start_time = time.time()
                 for line_idx, line in enumerate(file):
                     if limit is not None and line_idx >= limit:
@@ -51,14 +208,151 @@ class TwitterGraph:
                         print(f"Processed {line_idx}/{total_lines} lines in time: {round(stop_time - start_time, 2)} seconds.")
                         start_time = time.time()
                     follower, followed = line.strip().split()
-                    self.create_follows_relationship(follower, followed)
+                    self.create_follows_relationship(int(follower), int(followed))
         except Exception as e:
             print(f"Error reading file: {e}")
+
+    def read_all_in_txt_batched(self, txt_file, batch_size=10000, limit=None):
+        """
+        Bulk load the follower list, writing batch_size edges per UNWIND transaction.
+        Returns the number of written edges and the throughput in edges/sec.
+        """
+        total_edges = 0
+        start_time = time.time()
+
+        def write_batch(session, rows):
+            batch_start = time.time()
+            session.execute_write(self._create_and_link_batch, rows)
+            elapsed = time.time() - start_time
+            print(f"Processed {total_edges + len(rows)} edges, batch of {len(rows)} in time: "
+                  f"{round(time.time() - batch_start, 2)} seconds, {round((total_edges + len(rows)) / elapsed)} edges/sec.")
+
+        with self.driver.session() as session:
+            for rows in self._batches(self._read_edges(txt_file, limit), batch_size):
+                write_batch(session, rows)
+                total_edges += len(rows)
+
+        elapsed = time.time() - start_time
+        edges_per_sec = total_edges / elapsed if elapsed > 0 else 0.0
+        print(f"Loaded {total_edges} edges in {round(elapsed, 2)} seconds ({round(edges_per_sec)} edges/sec).")
+        self._refresh_snapshot()
+        return {"edges": total_edges, "seconds": round(elapsed, 2), "edges_per_sec": round(edges_per_sec, 2)}
+
+    def read_all_in_txt_parallel(self, txt_file, workers=4, batch_size=10000, limit=None, max_retries=5):
+        """
+        Load the follower list from several sessions at once in two phases.
+        First all users are created, then the relationships are sharded by follower id.
+        MERGE of a relationship locks both of its nodes, and a user can be a follower in one shard
+        and followed in another, so the workers can still deadlock. Every batch takes its locks in
+        order of the followed id to make that rarer, and a batch failing on a deadlock is retried
+        up to max_retries times with backoff. A batch that runs out of retries fails the load.
+        """
+        start_time = time.time()
+        followers, followed = EdgeListParser(txt_file).read_arrays(limit=limit)
+        user_ids = np.union1d(followers, followed).tolist()
+        print(f"Parsed {len(followers)} edges with {len(user_ids)} users in time: {round(time.time() - start_time, 2)} seconds.")
+
+        # phase 1: create the users, each user id is in exactly one batch
+        phase_start = time.time()
+        user_batches = list(self._batches(user_ids, batch_size))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda batch: self._write_with_retry(self._create_users_batch, batch, max_retries), user_batches))
+        print(f"Created {len(user_ids)} users in time: {round(time.time() - phase_start, 2)} seconds.")
+
+        # phase 2: link the users, partitioned by follower id
+        phase_start = time.time()
+        partition_ids = followers % workers
+        # the partitions stay NumPy arrays, rows are only built for the batch being written
+        partitions = [(followers[partition_ids == worker], followed[partition_ids == worker])
+                      for worker in range(workers)]
+
+        def link_partition(partition):
+            partition_followers, partition_followed = partition
+            with self.driver.session() as session:
+                for start in range(0, len(partition_followers), batch_size):
+                    batch_followers = partition_followers[start:start + batch_size]
+                    batch_followed = partition_followed[start:start + batch_size]
+                    # sorted by followed id, so concurrent batches lock the shared followed users in the same order
+                    order = np.lexsort((batch_followers, batch_followed))
+                    rows = self._edge_rows(batch_followers[order], batch_followed[order])
+                    self._write_with_retry(self._link_existing_batch, rows, max_retries, session=session)
+            return len(partition_followers)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            total_edges = sum(executor.map(link_partition, partitions))
+        print(f"Linked {total_edges} edges in time: {round(time.time() - phase_start, 2)} seconds.")
+
+        # the workers share followed users, so the counters are set in one pass afterwards
+        self.recompute_follow_counts(batch_size=batch_size)
+
+        elapsed = time.time() - start_time
+        edges_per_sec = total_edges / elapsed if elapsed > 0 else 0.0
+        print(f"Loaded {total_edges} edges with {workers} workers in {round(elapsed, 2)} seconds ({round(edges_per_sec)} edges/sec).")
+        self._refresh_snapshot()
+        return {"edges": total_edges, "users": len(user_ids), "workers": workers,
+                "seconds": round(elapsed, 2), "edges_per_sec": round(edges_per_sec, 2)}
+
+    def _refresh_snapshot(self):
+        # bulk loads are too large for the snapshot delta, rebuild it instead
+        self.leaderboard = None
+        self._invalidate_follow_most_cache()
+        if self.snapshot is not None:
+            self.snapshot.refresh()
+
+    def _write_with_retry(self, work, rows, max_retries=5, session=None, backoff=0.5):
+        for attempt in range(max_retries + 1):
+            try:
+                if session is None:
+                    with self.driver.session() as own_session:
+                        return own_session.execute_write(work, rows)
+                return session.execute_write(work, rows)
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                wait = backoff * (2 ** attempt) + random.uniform(0, backoff)
+                print(f"Batch of {len(rows)} failed ({e}), retry {attempt + 1}/{max_retries} in {round(wait, 2)} seconds.")
+                time.sleep(wait)
+
+    @staticmethod
+    def _edge_rows(followers, followed):
+        return [{"follower": follower, "followed": followed_id}
+                for follower, followed_id in zip(followers.tolist(), followed.tolist())]
+
+    @classmethod
+    def _read_edges(cls, txt_file, limit=None):
+        for followers, followed in EdgeListParser(txt_file).iter_chunks(limit=limit):
+            yield from cls._edge_rows(followers, followed)
+
+    @staticmethod
+    def _batches(items, batch_size):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
     
+    def get_all_edges(self):
+        """
+        Return all FOLLOWS relationships as two int64 arrays (followers, followed).
+        """
+        def process_result(tx):
+            query = "MATCH (a:User)-[:FOLLOWS]->(b:User) RETURN a.id AS follower, b.id AS followed"
+            followers = []
+            followed = []
+            for record in tx.run(query):
+                followers.append(record["follower"])
+                followed.append(record["followed"])
+            return np.array(followers, dtype=np.int64), np.array(followed, dtype=np.int64)
+
+        with self.driver.session() as session:
+            return session.execute_read(process_result)
+
     def get_all_users(self):
         def process_result(tx):
-            query = "MATCH (u:User) RETURN u.id AS user"
-            result = tx.run(query)
+            result = tx.run(queries.ALL_USERS)
             return [record["user"] for record in result]
 
         with self.driver.session() as session:
@@ -66,15 +360,69 @@ class TwitterGraph:
         
         return result_list
 
+    def get_users_page(self, after_id=None, page_size=1000):
+        """
+        Return up to page_size user ids greater than after_id in ascending order (keyset pagination).
+        """
+        def process_result(tx):
+            query = queries.USERS_FIRST_PAGE if after_id is None else queries.USERS_PAGE_AFTER
+            result = tx.run(query, after_id=after_id, page_size=page_size)
+            return [record["user"] for record in result]
+
+        with self.driver.session() as session:
+            return session.execute_read(process_result)
+
+    def iter_all_users(self, page_size=10000):
+        # every page is read in its own short transaction, so no session is held between pages
+        after_id = None
+        while True:
+            page = self.get_users_page(after_id=after_id, page_size=page_size)
+            yield from page
+            if len(page) < page_size:
+                break
+            after_id = page[-1]
+
+    def sample_users(self, n=100):
+        """
+        Return n random user ids, sampled on the server.
+        """
+        def process_result(tx):
+            result = tx.run(queries.SAMPLE_USERS, n=n)
+            return [record["user"] for record in result]
+
+        with self.driver.session() as session:
+            return session.execute_read(process_result)
+
     def find_users_with_most_followers(self, limit=100):
+        fetch_limit = self.most_followers_fetch_limit(limit)
+        records = self._query_users_with_most_followers(fetch_limit) if fetch_limit is not None else None
+        return self.most_followers_from_records(limit, records)
+
+    def most_followers_fetch_limit(self, limit):
+        """
+        How many of the most followed users have to be read with USERS_WITH_MOST_FOLLOWERS to answer
+        limit, None if the leaderboard answers it. The async graph reads them with its own driver.
+        """
+        if limit > self.leaderboard_capacity:
+            return limit
+        if self.leaderboard is None:
+            return self.leaderboard_capacity
+        return None
+
+    def most_followers_from_records(self, limit, records=None):
+        """
+        The limit most followed users, from the records read for most_followers_fetch_limit.
+        Records of the leaderboard capacity start the leaderboard.
+        """
+        if limit > self.leaderboard_capacity:
+            return records
+        if self.leaderboard is None:
+            self.leaderboard = TopKLeaderboard(records, capacity=self.leaderboard_capacity)
+        return self.leaderboard.top(limit)
+
+    def _query_users_with_most_followers(self, limit):
         def process_result(tx, limit=limit):
-            query = (
-                "MATCH (a:User)<-[:FOLLOWS]-(b) "
-                "RETURN a.id AS user, count(b) AS followersCount "
-                "ORDER BY followersCount DESC "
-                f"LIMIT {limit}"
-            )
-            result = tx.run(query)
+            result = tx.run(queries.USERS_WITH_MOST_FOLLOWERS, limit=limit)
             return [record.data() for record in result]
 
         with self.driver.session() as session:
@@ -84,43 +432,54 @@ class TwitterGraph:
     
     def find_users_which_follow_most(self, limit=100, followed_users=None):
         def process_result(tx, limit=limit, followed_users=followed_users):
-            # Convert the list of followed users to a string format suitable for the Cypher query
-            followed_users_str = str(followed_users).replace('[', '').replace(']', '')
-            query = (
-                "MATCH (a:User)-[:FOLLOWS]->(b) "
-                "WHERE b.id IN [" + followed_users_str + "] "
-                "RETURN a.id AS user, count(b) AS followsCount "
-                "ORDER BY followsCount DESC "
-                f"LIMIT {limit}"
-            )
-            result = tx.run(query)
+            result = tx.run(queries.USERS_WHICH_FOLLOW_MOST, followed_users=followed_users, limit=limit)
             return [record.data() for record in result]
 
-        if followed_users is None or not followed_users:
-            raise ValueError("followed_users must be a non-empty list of user ids")
+        followed_users = queries.followed_users_param(followed_users)
+        cached, generation = self.get_cached_follow_most(followed_users, limit)
+        if cached is not None:
+            return cached
 
         with self.driver.session() as session:
-            result_list = session.execute_read(process_result)
-        
+            result_list = session.execute_read(process_result, followed_users=followed_users)
+
+        self.store_follow_most(followed_users, limit, result_list, generation)
         return result_list
 
-    def get_user_follow_stats(self, user_id):
-        def process_result(tx, user_id=user_id):
-            # Query to count how many users this user follows
-            follows_query = (
-                "MATCH (a:User {id: $user_id})-[:FOLLOWS]->(b) "
-                "RETURN count(b) AS followsCount"
-            )
-            follows_result = tx.run(follows_query, user_id=user_id).single()["followsCount"]
+    def get_cached_follow_most(self, followed_users, limit):
+        """
+        The cached find_users_which_follow_most result of the followed_users_param list and limit, or None,
+        and the cache generation to pass to store_follow_most.
+        """
+        cache_key = (tuple(followed_users), limit)
+        with self._cache_lock:
+            if cache_key in self.follow_most_cache:
+                self.follow_most_cache.move_to_end(cache_key)
+                return self.follow_most_cache[cache_key], self._cache_generation
+            return None, self._cache_generation
 
-            # Query to count how many followers this user has
-            followers_query = (
-                "MATCH (a:User {id: $user_id})<-[:FOLLOWS]-(b) "
-                "RETURN count(b) AS followersCount"
-            )
-            followers_result = tx.run(followers_query, user_id=user_id).single()["followersCount"]
+    def store_follow_most(self, followed_users, limit, result_list, generation):
+        cache_key = (tuple(followed_users), limit)
+        with self._cache_lock:
+            # skip results which may have been read before a concurrent write
+            if generation != self._cache_generation:
+                return
+            self.follow_most_cache[cache_key] = result_list
+            if len(self.follow_most_cache) > self.follow_most_cache_size:
+                self.follow_most_cache.popitem(last=False)
+
+    def _invalidate_follow_most_cache(self):
+        with self._cache_lock:
+            self._cache_generation += 1
+            self.follow_most_cache.clear()
 
-            return {"followsCount": follows_result, "followersCount": followers_result}
+    def get_user_follow_stats(self, user_id):
+        user_id = int(user_id)
+        def process_result(tx, user_id=user_id):
+            record = tx.run(queries.USER_FOLLOW_STATS, user_id=user_id).single()
+            if record is None:
+                return {"followsCount": 0, "followersCount": 0}
+            return record.data()
 
         with self.driver.session() as session:
             result = session.execute_read(process_result)
@@ -128,12 +487,11 @@ class TwitterGraph:
         return result
     
     def get_followed_users(self, user_id):
+        user_id = int(user_id)
+        if self.snapshot is not None:
+            return [{"followed": followed} for followed in self.snapshot.get_followed_users(user_id)]
         def process_result(tx, user_id=user_id):
-            query = (
-                "MATCH (a:User {id: $user_id})-[:FOLLOWS]->(b) "
-                "RETURN b.id AS followed"
-            )
-            result = tx.run(query, user_id=user_id)
+            result = tx.run(queries.FOLLOWED_USERS, user_id=user_id)
             return [record.data() for record in result]
 
         with self.driver.session() as session:
@@ -142,18 +500,67 @@ class TwitterGraph:
         return result_list
     
     def get_followers(self, user_id):
+        user_id = int(user_id)
+        if self.snapshot is not None:
+            return [{"follower": follower} for follower in self.snapshot.get_followers(user_id)]
         def process_result(tx, user_id=user_id):
-            query = (
-                "MATCH (a:User {id: $user_id})<-[:FOLLOWS]-(b) "
-                "RETURN b.id AS follower"
-            )
-            result = tx.run(query, user_id=user_id)
+            result = tx.run(queries.FOLLOWERS, user_id=user_id)
             return [record.data() for record in result]
 
         with self.driver.session() as session:
             result_list = session.execute_read(process_result)
         
         return result_list
+
+    def get_followed_users_above(self, user_id, min_followers):
+        """
+        Return the users followed by user_id which have more than min_followers followers.
+        """
+        def process_result(tx):
+            query = (
+                "MATCH (a:User {id: $user_id})-[:FOLLOWS]->(b:User) "
+                "WHERE b.followersCount > $min_followers "
+                "RETURN b.id AS followed"
+            )
+            result = tx.run(query, user_id=int(user_id), min_followers=min_followers)
+            return [record["followed"] for record in result]
+
+        with self.driver.session() as session:
+            return session.execute_read(process_result)
+
+    def iter_neighbors_many(self, user_ids, direction="followers", chunk_size=1000):
+        """
+        Yield {user_id: [neighbor ids]} dicts for chunks of user_ids, one UNWIND query per chunk.
+        direction is "followers" (who follows the user) or "followed" (whom the user follows).
+        """
+        query = queries.neighbors_many_query(direction)
+
+        def process_result(tx, chunk):
+            result = tx.run(query, user_ids=chunk)
+            return {record["user_id"]: record["neighbors"] for record in result}
+
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        for chunk in self._batches(user_ids, chunk_size):
+            if self.snapshot is not None:
+                lookup = self.snapshot.get_followers if direction == "followers" else self.snapshot.get_followed_users
+                yield {user_id: lookup(user_id) for user_id in chunk}
+                continue
+            with self.driver.session() as session:
+                neighbors = session.execute_read(process_result, chunk)
+            # users without any relationship are not returned by the MATCH
+            yield {user_id: neighbors.get(user_id, []) for user_id in chunk}
+
+    def get_followers_many(self, user_ids, chunk_size=1000):
+        result = {}
+        for chunk in self.iter_neighbors_many(user_ids, direction="followers", chunk_size=chunk_size):
+            result.update(chunk)
+        return result
+
+    def get_followed_users_many(self, user_ids, chunk_size=1000):
+        result = {}
+        for chunk in self.iter_neighbors_many(user_ids, direction="followed", chunk_size=chunk_size):
+            result.update(chunk)
+        return result
     
 
 if __name__ == "__main__":
@@ -167,6 +574,7 @@ if __name__ == "__main__":
     # read all data from txt file
     txt_file = "api_service/data/twitter_combined.txt"
     graph.clean_database()
+    graph.setup_schema()
     graph.read_all_in_txt(txt_file)
     
     print('-' * 100)
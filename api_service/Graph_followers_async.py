@@ -0,0 +1,110 @@
+from neo4j import AsyncGraphDatabase
+import Graph_queries as queries
+
+
+class AsyncTwitterGraph:
+    """
+    Async variant of the TwitterGraph read queries, built on the AsyncGraphDatabase driver,
+    so FastAPI routes can await neo4j instead of blocking a threadpool worker.
+    Writes and bulk imports stay on the synchronous TwitterGraph. If a TwitterGraph is given,
+    its in-process read models (snapshot, leaderboard and follow_most cache) are shared.
+    """
+    def __init__(self, uri, user, password, max_connection_pool_size=100, connection_acquisition_timeout=60.0, graph=None):
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password),
+                                                max_connection_pool_size=max_connection_pool_size,
+                                                connection_acquisition_timeout=connection_acquisition_timeout)
+        self.graph = graph
+
+    async def close(self):
+        await self.driver.close()
+
+    async def _read(self, query, **params):
+        async def process_result(tx):
+            result = await tx.run(query, **params)
+            return await result.data()
+
+        async with self.driver.session() as session:
+            return await session.execute_read(process_result)
+
+    async def get_user_count(self):
+        records = await self._read(queries.USER_COUNT)
+        return records[0]["userCount"]
+
+    async def get_all_users(self):
+        records = await self._read(queries.ALL_USERS)
+        return [record["user"] for record in records]
+
+    async def get_users_page(self, after_id=None, page_size=1000):
+        query = queries.USERS_FIRST_PAGE if after_id is None else queries.USERS_PAGE_AFTER
+        records = await self._read(query, after_id=after_id, page_size=page_size)
+        return [record["user"] for record in records]
+
+    async def iter_all_users(self, page_size=10000):
+        after_id = None
+        while True:
+            page = await self.get_users_page(after_id=after_id, page_size=page_size)
+            for user_id in page:
+                yield user_id
+            if len(page) < page_size:
+                break
+            after_id = page[-1]
+
+    async def sample_users(self, n=100):
+        records = await self._read(queries.SAMPLE_USERS, n=n)
+        return [record["user"] for record in records]
+
+    async def find_users_with_most_followers(self, limit=100):
+        if self.graph is None:
+            return await self._query_users_with_most_followers(limit)
+        fetch_limit = self.graph.most_followers_fetch_limit(limit)
+        records = await self._query_users_with_most_followers(fetch_limit) if fetch_limit is not None else None
+        return self.graph.most_followers_from_records(limit, records)
+
+    async def _query_users_with_most_followers(self, limit):
+        return await self._read(queries.USERS_WITH_MOST_FOLLOWERS, limit=limit)
+
+    async def find_users_which_follow_most(self, limit=100, followed_users=None):
+        followed_users = queries.followed_users_param(followed_users)
+        generation = None
+        if self.graph is not None:
+            cached, generation = self.graph.get_cached_follow_most(followed_users, limit)
+            if cached is not None:
+                return cached
+
+        result_list = await self._read(queries.USERS_WHICH_FOLLOW_MOST, followed_users=followed_users, limit=limit)
+        if self.graph is not None:
+            self.graph.store_follow_most(followed_users, limit, result_list, generation)
+        return result_list
+
+    async def get_user_follow_stats(self, user_id):
+        records = await self._read(queries.USER_FOLLOW_STATS, user_id=int(user_id))
+        if not records:
+            return {"followsCount": 0, "followersCount": 0}
+        return records[0]
+
+    async def get_followed_users(self, user_id):
+        user_id = int(user_id)
+        if self.graph is not None and self.graph.snapshot is not None:
+            return [{"followed": followed} for followed in self.graph.snapshot.get_followed_users(user_id)]
+        return await self._read(queries.FOLLOWED_USERS, user_id=user_id)
+
+    async def get_followers(self, user_id):
+        user_id = int(user_id)
+        if self.graph is not None and self.graph.snapshot is not None:
+            return [{"follower": follower} for follower in self.graph.snapshot.get_followers(user_id)]
+        return await self._read(queries.FOLLOWERS, user_id=user_id)
+
+    async def get_neighbors_many(self, user_ids, direction="followers", chunk_size=1000):
+        query = queries.neighbors_many_query(direction)
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        snapshot = self.graph.snapshot if self.graph is not None else None
+        if snapshot is not None:
+            lookup = snapshot.get_followers if direction == "followers" else snapshot.get_followed_users
+            return {user_id: lookup(user_id) for user_id in user_ids}
+        result = {}
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            records = await self._read(query, user_ids=chunk)
+            neighbors = {record["user_id"]: record["neighbors"] for record in records}
+            result.update({user_id: neighbors.get(user_id, []) for user_id in chunk})
+        return result
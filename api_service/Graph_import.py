@@ -0,0 +1,141 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import time as time
+from neo4j import GraphDatabase
+from Edge_parser import EdgeListParser
+from Graph_followers import TwitterGraph
+
+# import directory of the neo4j container, mounted from ${USERPROFILE}/neo4j/import1 (see docker-compose.yaml)
+CONTAINER_IMPORT_DIR = "/var/lib/neo4j/import"
+DEFAULT_IMPORT_DIR = os.getenv("NEO4J_IMPORT_DIR", CONTAINER_IMPORT_DIR)
+
+
+class GraphAdminImport:
+    """
+    Offline cold start of the follower graph with `neo4j-admin database import`.
+    The edge list is turned into deduplicated nodes.csv/relationships.csv files in the
+    neo4j-admin header format, which are then imported into an empty, stopped database.
+    """
+    def __init__(self, import_dir=DEFAULT_IMPORT_DIR, database="neo4j"):
+        self.import_dir = import_dir
+        self.database = database
+        self.nodes_file = os.path.join(import_dir, "nodes.csv")
+        self.relationships_file = os.path.join(import_dir, "relationships.csv")
+
+    def write_csv_files(self, txt_file, limit=None):
+        start_time = time.time()
+        followers, followed = EdgeListParser(txt_file).read_arrays(limit=limit)
+
+        # deduplicate the edges and collect every user that occurs on either side
+        edges = np.unique(np.stack([followers, followed], axis=1), axis=0)
+        users = np.union1d(edges[:, 0], edges[:, 1])
+        # materialized degree counters, as maintained by TwitterGraph for transactional writes
+        followers_count = np.bincount(np.searchsorted(users, edges[:, 1]), minlength=len(users))
+        follows_count = np.bincount(np.searchsorted(users, edges[:, 0]), minlength=len(users))
+
+        os.makedirs(self.import_dir, exist_ok=True)
+        with open(self.nodes_file, "w") as file:
+            file.write("id:ID(User),followersCount:long,followsCount:long,:LABEL\n")
+            np.savetxt(file, np.stack([users, followers_count, follows_count], axis=1), fmt="%d,%d,%d,User")
+        with open(self.relationships_file, "w") as file:
+            file.write(":START_ID(User),:END_ID(User),:TYPE\n")
+            np.savetxt(file, edges, fmt="%d,%d,FOLLOWS")
+
+        print(f"Wrote {len(users)} users and {len(edges)} relationships to {self.import_dir} "
+              f"in time: {round(time.time() - start_time, 2)} seconds.")
+        return {"users": len(users), "relationships": len(edges),
+                "nodes_file": self.nodes_file, "relationships_file": self.relationships_file}
+
+    def import_command(self, container=None, image=None):
+        nodes_file, relationships_file = self.nodes_file, self.relationships_file
+        if container:
+            # the files are read inside the container, from its mount of the import directory
+            nodes_file = os.path.join(CONTAINER_IMPORT_DIR, os.path.basename(nodes_file))
+            relationships_file = os.path.join(CONTAINER_IMPORT_DIR, os.path.basename(relationships_file))
+        command = [
+            "neo4j-admin", "database", "import", "full",
+            f"--nodes={nodes_file}",
+            f"--relationships={relationships_file}",
+            "--overwrite-destination=true",
+            "--id-type=integer",
+            self.database,
+        ]
+        if container:
+            # a one-off container of the same image with the volumes of the stopped neo4j container
+            command = ["docker", "run", "--rm", f"--volumes-from={container}", image] + command
+        return command
+
+    def run_import(self, container=None):
+        """
+        Run neo4j-admin import. The target database has to be offline while importing: with a
+        container, it is stopped, the import runs in a one-off container on its volumes and the
+        container is started again. Without one, neo4j-admin of a stopped local installation is used.
+        """
+        image = None
+        if container:
+            image = subprocess.run(["docker", "inspect", "--format", "{{.Config.Image}}", container],
+                                   check=True, capture_output=True, text=True).stdout.strip()
+            print(f"Stopping {container}")
+            subprocess.run(["docker", "stop", container], check=True)
+        try:
+            command = self.import_command(container, image=image)
+            print(f"Running: {' '.join(command)}")
+            start_time = time.time()
+            subprocess.run(command, check=True)
+            print(f"Import finished in time: {round(time.time() - start_time, 2)} seconds.")
+        finally:
+            if container:
+                print(f"Starting {container}")
+                subprocess.run(["docker", "start", container], check=True)
+
+    @staticmethod
+    def wait_for_bolt(uri, user, password, timeout=120, interval=2):
+        """
+        Wait until neo4j accepts bolt connections again after the restart.
+        """
+        deadline = time.time() + timeout
+        while True:
+            driver = GraphDatabase.driver(uri, auth=(user, password))
+            try:
+                driver.verify_connectivity()
+                return
+            except Exception as e:
+                if time.time() > deadline:
+                    raise RuntimeError(f"neo4j at {uri} not reachable after {timeout} seconds: {e}")
+                time.sleep(interval)
+            finally:
+                driver.close()
+
+    @staticmethod
+    def verify_import(graph, expected_users, expected_relationships):
+        user_count = graph.get_user_count()
+        relationship_count = graph.get_follows_count()
+        if user_count != expected_users or relationship_count != expected_relationships:
+            raise RuntimeError(f"Import verification failed: expected {expected_users} users and {expected_relationships} "
+                               f"relationships, found {user_count} users and {relationship_count} relationships")
+        print(f"Import verified with {user_count} users and {relationship_count} relationships.")
+        return user_count, relationship_count
+
+
+if __name__ == "__main__":
+    # Usage: NEO4J_IMPORT_DIR=<host import dir> python Graph_import.py <twitter_combined.txt> [neo4j container name]
+    # With a container name the container is stopped for the import and started again afterwards.
+    txt_file = sys.argv[1] if len(sys.argv) > 1 else "api_service/data/twitter_combined.txt"
+    container = sys.argv[2] if len(sys.argv) > 2 else None
+
+    admin_import = GraphAdminImport()
+    stats = admin_import.write_csv_files(txt_file)
+    admin_import.run_import(container=container)
+
+    uri = os.getenv("NEO4J_URI_1", "bolt://localhost:7687")
+    user = os.getenv("NEO4J_USER", "neo4j")
+    password = os.getenv("NEO4J_PASSWORD", "testtest")
+    # without a container the database is started by hand, the wait covers that as well
+    GraphAdminImport.wait_for_bolt(uri, user, password, timeout=600 if container is None else 120)
+    graph = TwitterGraph(uri, user, password)
+    try:
+        GraphAdminImport.verify_import(graph, stats["users"], stats["relationships"])
+    finally:
+        graph.close()
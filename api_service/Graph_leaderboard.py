@@ -0,0 +1,42 @@
+import threading
+
+
+class TopKLeaderboard:
+    """
+    Most followed users, kept current from the follower counts written by new follows.
+    Follower counts only grow, so a user outside the board can only enter it by passing the
+    smallest count on the board, which keeps the board exact with O(k) work per update and
+    makes reads a slice of a precomputed list.
+    """
+    def __init__(self, records, capacity=1000):
+        # records: [{"user": id, "followersCount": count}, ...] of the current top users
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._counts = {record["user"]: record["followersCount"] for record in records[:capacity]}
+        self._ranking = self._rank()
+
+    def _rank(self):
+        ranked = sorted(self._counts.items(), key=lambda item: (-item[1], item[0]))
+        return [{"user": user, "followersCount": count} for user, count in ranked]
+
+    def update(self, user_id, followers_count):
+        if followers_count is None:
+            # an unknown count cannot be ranked
+            return
+        with self._lock:
+            if user_id in self._counts:
+                self._counts[user_id] = followers_count
+            elif len(self._counts) < self.capacity:
+                self._counts[user_id] = followers_count
+            else:
+                min_user = min(self._counts, key=self._counts.get)
+                if followers_count <= self._counts[min_user]:
+                    return
+                del self._counts[min_user]
+                self._counts[user_id] = followers_count
+            self._ranking = self._rank()
+
+    def top(self, limit):
+        if limit > self.capacity:
+            raise ValueError(f"limit must not exceed the leaderboard capacity of {self.capacity}")
+        return self._ranking[:limit]
@@ -0,0 +1,73 @@
+# Cypher read queries shared by TwitterGraph and AsyncTwitterGraph, so both paths run the same statements
+
+USER_COUNT = "MATCH (u:User) RETURN COUNT(u) AS userCount"
+
+ALL_USERS = "MATCH (u:User) RETURN u.id AS user"
+
+USERS_FIRST_PAGE = "MATCH (u:User) WHERE u.id IS NOT NULL RETURN u.id AS user ORDER BY u.id LIMIT $page_size"
+
+USERS_PAGE_AFTER = "MATCH (u:User) WHERE u.id > $after_id RETURN u.id AS user ORDER BY u.id LIMIT $page_size"
+
+SAMPLE_USERS = "MATCH (u:User) WITH u.id AS user ORDER BY rand() LIMIT $n RETURN user"
+
+USERS_WITH_MOST_FOLLOWERS = (
+    "MATCH (a:User) WHERE a.followersCount > 0 "
+    "RETURN a.id AS user, a.followersCount AS followersCount "
+    "ORDER BY followersCount DESC "
+    "LIMIT $limit"
+)
+
+# the ids are passed as a list parameter, so every call shares one cached query plan
+USERS_WHICH_FOLLOW_MOST = (
+    "UNWIND $followed_users AS followed_id "
+    "MATCH (a:User)-[:FOLLOWS]->(b:User {id: followed_id}) "
+    "RETURN a.id AS user, count(b) AS followsCount "
+    "ORDER BY followsCount DESC "
+    "LIMIT $limit"
+)
+
+
+def followed_users_param(followed_users):
+    """
+    The $followed_users parameter of USERS_WHICH_FOLLOW_MOST: distinct integer ids in ascending order,
+    which is also the key of the cached results.
+    """
+    if not followed_users:
+        raise ValueError("followed_users must be a non-empty list of user ids")
+    return sorted({int(user_id) for user_id in followed_users})
+
+
+USER_FOLLOW_STATS = (
+    "MATCH (a:User {id: $user_id}) "
+    "RETURN coalesce(a.followsCount, 0) AS followsCount, "
+    "coalesce(a.followersCount, 0) AS followersCount"
+)
+
+FOLLOWED_USERS = (
+    "MATCH (a:User {id: $user_id})-[:FOLLOWS]->(b) "
+    "RETURN b.id AS followed"
+)
+
+FOLLOWERS = (
+    "MATCH (a:User {id: $user_id})<-[:FOLLOWS]-(b) "
+    "RETURN b.id AS follower"
+)
+
+_NEIGHBOR_PATTERNS = {
+    "followers": "(a:User {id: user_id})<-[:FOLLOWS]-(b:User)",
+    "followed": "(a:User {id: user_id})-[:FOLLOWS]->(b:User)",
+}
+
+
+def neighbors_many_query(direction):
+    """
+    UNWIND query returning the neighbor ids of a list of users.
+    direction is "followers" (who follows the user) or "followed" (whom the user follows).
+    """
+    if direction not in _NEIGHBOR_PATTERNS:
+        raise ValueError("direction must be 'followers' or 'followed'")
+    return (
+        "UNWIND $user_ids AS user_id "
+        f"MATCH {_NEIGHBOR_PATTERNS[direction]} "
+        "RETURN user_id, collect(b.id) AS neighbors"
+    )
@@ -0,0 +1,125 @@
+import threading
+import numpy as np
+import time as time
+from Edge_parser import EdgeListParser
+
+
+class FollowGraphSnapshot:
+    """
+    In-process read model of the follow graph as compressed sparse row (CSR) adjacency arrays.
+    Both directions are kept: out-edges (users a user follows) and in-edges (followers of a user).
+    Follows written after the last build are kept in a small delta until the next refresh.
+    """
+    def __init__(self, followers, followed, source=None):
+        # source is a callable returning fresh (followers, followed) arrays for refresh()
+        self.source = source
+        self._lock = threading.Lock()
+        self._pending = {"followed": {}, "followers": {}}
+        self._stop_event = threading.Event()
+        self._refresh_thread = None
+        self._build(followers, followed)
+
+    @classmethod
+    def from_edge_file(cls, txt_file, limit=None):
+        parser = EdgeListParser(txt_file)
+        return cls(*parser.read_arrays(limit=limit), source=lambda: parser.read_arrays(limit=limit))
+
+    @classmethod
+    def from_graph(cls, graph):
+        return cls(*graph.get_all_edges(), source=graph.get_all_edges)
+
+    @staticmethod
+    def _csr(row_idx, neighbors, n_rows):
+        order = np.argsort(row_idx, kind="stable")
+        offsets = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_idx, minlength=n_rows), out=offsets[1:])
+        return offsets, neighbors[order]
+
+    def _build(self, followers, followed):
+        start_time = time.time()
+        edges = np.unique(np.stack([np.asarray(followers, dtype=np.int64),
+                                    np.asarray(followed, dtype=np.int64)], axis=1), axis=0)
+        followers, followed = edges[:, 0], edges[:, 1]
+        user_ids = np.union1d(followers, followed)
+        out_offsets, out_neighbors = self._csr(np.searchsorted(user_ids, followers), followed, len(user_ids))
+        in_offsets, in_neighbors = self._csr(np.searchsorted(user_ids, followed), followers, len(user_ids))
+        state = {
+            "user_ids": user_ids,
+            "followed": (out_offsets, out_neighbors),
+            "followers": (in_offsets, in_neighbors),
+            "edge_count": len(edges),
+        }
+        with self._lock:
+            self._state = state
+            # drop pending follows which are part of the new snapshot
+            for direction, pending in self._pending.items():
+                for user_id in list(pending):
+                    pending[user_id] -= set(self._base_neighbors(user_id, direction).tolist())
+                    if not pending[user_id]:
+                        del pending[user_id]
+        print(f"Built follow graph snapshot with {len(user_ids)} users and {len(edges)} edges "
+              f"in time: {round(time.time() - start_time, 2)} seconds.")
+
+    def _base_neighbors(self, user_id, direction):
+        state = self._state
+        user_ids = state["user_ids"]
+        offsets, neighbors = state[direction]
+        idx = np.searchsorted(user_ids, user_id)
+        if idx < len(user_ids) and user_ids[idx] == user_id:
+            return neighbors[offsets[idx]:offsets[idx + 1]]
+        return neighbors[:0]
+
+    def _neighbors(self, user_id, direction):
+        user_id = int(user_id)
+        with self._lock:
+            neighbors = self._base_neighbors(user_id, direction).tolist()
+            pending = self._pending[direction].get(user_id)
+            if pending:
+                neighbors.extend(pending)
+        return neighbors
+
+    def get_followers(self, user_id):
+        return self._neighbors(user_id, "followers")
+
+    def get_followed_users(self, user_id):
+        return self._neighbors(user_id, "followed")
+
+    def add_edge(self, follower, followed):
+        follower, followed = int(follower), int(followed)
+        with self._lock:
+            if followed in self._base_neighbors(follower, "followed"):
+                return
+            self._pending["followed"].setdefault(follower, set()).add(followed)
+            self._pending["followers"].setdefault(followed, set()).add(follower)
+
+    def refresh(self):
+        if self.source is None:
+            raise ValueError("Snapshot has no source to refresh from")
+        self._build(*self.source())
+
+    def start_refresh(self, interval=300):
+        """
+        Rebuild the snapshot from its source every interval seconds in a background thread.
+        """
+        def refresh_loop():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing follow graph snapshot: {e}")
+
+        if self._refresh_thread is None:
+            self._stop_event.clear()
+            self._refresh_thread = threading.Thread(target=refresh_loop, daemon=True)
+            self._refresh_thread.start()
+
+    def stop_refresh(self):
+        self._stop_event.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(neighbors) for neighbors in self._pending["followed"].values())
+            return {"users": len(self._state["user_ids"]), "edges": self._state["edge_count"], "pending_edges": pending}
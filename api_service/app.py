@@ -4,15 +4,21 @@ from fastapi.responses import JSONResponse
 from typing import List
 from typing import Optional
 from fastapi.responses import RedirectResponse
+from fastapi.responses import StreamingResponse
 import os
 import asyncio
 from Graph_followers import TwitterGraph
+from Graph_followers_async import AsyncTwitterGraph
+from Graph_import import GraphAdminImport
+from Graph_snapshot import FollowGraphSnapshot
 from DB_tweet import Tweet_DB
+from DB_profiles import build_execution_profiles
 import uvicorn
 import requests
 import logging
+import base64
+import binascii
 from uuid import UUID
-from datetime import datetime
 
 
 description = """
@@ -42,19 +48,61 @@ uri = os.getenv("NEO4J_URI_1")
 user = os.getenv("NEO4J_USER")
 password = os.getenv("NEO4J_PASSWORD")
 
-graph = TwitterGraph(uri, user, password)
+# Connection pool of each neo4j driver, and how long a request waits for a free connection
+neo4j_max_pool_size = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+neo4j_acquisition_timeout = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "60"))
+
+graph = TwitterGraph(uri, user, password, max_connection_pool_size=neo4j_max_pool_size,
+                     connection_acquisition_timeout=neo4j_acquisition_timeout)
+# async driver for the read routes, sharing the in-process read models of graph
+async_graph = AsyncTwitterGraph(uri, user, password, max_connection_pool_size=neo4j_max_pool_size,
+                                connection_acquisition_timeout=neo4j_acquisition_timeout, graph=graph)
+
+# Optional in-process follow graph snapshot, rebuilt every GRAPH_SNAPSHOT_REFRESH seconds
+use_graph_snapshot = os.getenv("GRAPH_SNAPSHOT", "false").lower() in ("1", "true", "yes")
+graph_snapshot_refresh = int(os.getenv("GRAPH_SNAPSHOT_REFRESH", "300"))
+
+# TwitterDB connection details, CASSANDRA_HOST is a comma separated list of contact points
+cassandra_hosts = os.getenv("CASSANDRA_HOST", "cassandra_node1").split(",")
+cassandra_port = int(os.getenv("CASSANDRA_PORT", "9042"))
+# execution profiles of the interactive, fan-out and bulk import workloads
+cassandra_profiles = build_execution_profiles(
+    local_dc=os.getenv("CASSANDRA_LOCAL_DC") or None,
+    consistency=os.getenv("CASSANDRA_CONSISTENCY", "LOCAL_ONE"),
+    bulk_consistency=os.getenv("CASSANDRA_BULK_CONSISTENCY", "LOCAL_QUORUM"),
+    request_timeout=float(os.getenv("CASSANDRA_REQUEST_TIMEOUT", "2.0")),
+    fanout_timeout=float(os.getenv("CASSANDRA_FANOUT_TIMEOUT", "10.0")),
+    bulk_timeout=float(os.getenv("CASSANDRA_BULK_TIMEOUT", "60.0")),
+    speculative_delay=float(os.getenv("CASSANDRA_SPECULATIVE_DELAY", "0.05")))
+
+tweet_db = Tweet_DB(hosts=cassandra_hosts, keyspace='tweets', port=cassandra_port,
+                    execution_profiles=cassandra_profiles,
+                    compression=os.getenv("CASSANDRA_COMPRESSION", "true").lower() in ("1", "true", "yes"),
+                    fetch_size=int(os.getenv("CASSANDRA_FETCH_SIZE", "100")),
+                    cache_ttl=int(os.getenv("CACHE_TTL", str(7 * 24 * 3600))),
+                    cache_trim_interval=int(os.getenv("CACHE_TRIM_INTERVAL", "60")),
+                    fanout_threshold=int(os.getenv("FANOUT_THRESHOLD")) if os.getenv("FANOUT_THRESHOLD") else None,
+                    like_flush_interval=float(os.getenv("LIKE_FLUSH_INTERVAL", "1.0")),
+                    tweet_body_cache_size=int(os.getenv("TWEET_BODY_CACHE_SIZE", "10000")))
+
+
+@app.on_event("startup")
+def setup_graph_schema():
+    try:
+        graph.setup_schema()
+    except Exception as e:
+        logger.warning(f"Could not set up the graph schema: {e}")
+    if use_graph_snapshot:
+        try:
+            graph.snapshot = FollowGraphSnapshot.from_graph(graph)
+            graph.snapshot.start_refresh(graph_snapshot_refresh)
+        except Exception as e:
+            logger.warning(f"Could not build the follow graph snapshot: {e}")
 
-# TwitterDB connection details
-tweet_db = Tweet_DB(hosts=['cassandra_node1'], keyspace='tweets')
 
-
-def validate_tweet_date(tweet_date: str) -> datetime:
-    try:
-        # Attempt to parse the tweet_date string into a datetime object
-        return datetime.strptime(tweet_date, "%Y-%m-%dT%H:%M:%S.%f")
-    except ValueError:
-        # If parsing fails, raise an HTTPException that will be returned as a response
-        raise HTTPException(status_code=400, detail="Invalid tweet_date format. Expected format: 'YYYY-MM-DDTHH:MM:SS.ssssss'")
+@app.on_event("shutdown")
+async def close_async_graph():
+    await async_graph.close()
 
 
 @app.get("/", include_in_schema=False)
@@ -80,10 +128,22 @@ def clean_database():
     
 
 @app.post('/process_txt_file', tags=["neo4j"])
-def process_txt_file(txt_file: str = 'data/twitter_combined.txt', limit: int = None):
+def process_txt_file(txt_file: str = 'data/twitter_combined.txt', limit: int = None,
+                     batch_size: Optional[int] = Query(None, description="Edges per UNWIND transaction, e.g. 10000-50000. If not set, edges are written one by one"),
+                     workers: Optional[int] = Query(None, description="Number of concurrent sessions for the parallel import. Uses batch_size or 10000 edges per transaction")):
     if not os.path.exists(txt_file):
         raise HTTPException(status_code=400, detail="File not found")
+    if batch_size is not None and batch_size <= 0:
+        raise HTTPException(status_code=400, detail="batch_size must be a positive integer")
+    if workers is not None and workers <= 0:
+        raise HTTPException(status_code=400, detail="workers must be a positive integer")
     try:
+        if workers:
+            stats = graph.read_all_in_txt_parallel(txt_file, workers=workers, batch_size=batch_size or 10000, limit=limit)
+            return {"message": "File got processed", **stats}
+        if batch_size:
+            stats = graph.read_all_in_txt_batched(txt_file, batch_size=batch_size, limit=limit)
+            return {"message": "File got processed", **stats}
         graph.read_all_in_txt(txt_file, limit=limit)
         return {"message": "File got processed"}
     except FileNotFoundError:
@@ -92,26 +152,70 @@ def process_txt_file(txt_file: str = 'data/twitter_combined.txt', limit: int = N
         raise HTTPException(status_code=500, detail="An error occurred processing your request")
 
 
+@app.post('/migrate_user_ids', tags=["neo4j"], description="Converts string user ids of graphs imported by older versions into integers")
+def migrate_user_ids(batch_size: int = 10000):
+    try:
+        result = graph.migrate_string_ids(batch_size=batch_size)
+        graph.setup_schema()
+        graph.recompute_follow_counts(batch_size=batch_size)
+        return {"message": "User ids migrated successfully", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred migrating the user ids")
+
+
+@app.post('/recompute_follow_counts', tags=["neo4j"], description="Recomputes the stored follower and follows counts of all users from their relationships")
+def recompute_follow_counts(batch_size: int = 10000):
+    try:
+        graph.recompute_follow_counts(batch_size=batch_size)
+        return {"message": "Follow counts recomputed successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred recomputing the follow counts")
+
+
+@app.post('/prepare_admin_import', tags=["neo4j"], description="Writes deduplicated nodes.csv/relationships.csv files for an offline `neo4j-admin database import` "
+                                                               "into the neo4j import directory. Run `python Graph_import.py` for the import itself")
+def prepare_admin_import(txt_file: str = 'data/twitter_combined.txt', limit: int = None):
+    if not os.path.exists(txt_file):
+        raise HTTPException(status_code=400, detail="File not found")
+    try:
+        stats = GraphAdminImport().write_csv_files(txt_file, limit=limit)
+        return {"message": "Import files written", **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred writing the import files")
+
+
+@app.post('/snapshot/refresh', tags=["neo4j"], description="Builds or rebuilds the in-process follow graph snapshot from neo4j")
+def refresh_snapshot():
+    try:
+        if graph.snapshot is None:
+            graph.snapshot = FollowGraphSnapshot.from_graph(graph)
+            graph.snapshot.start_refresh(graph_snapshot_refresh)
+        else:
+            graph.snapshot.refresh()
+        return {"message": "Snapshot refreshed successfully", **graph.snapshot.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred refreshing the snapshot")
+
 
 @app.get('/users/with_most_followers', tags=["neo4j"])
-def users_with_most_followers(limit: int = 100):
+async def users_with_most_followers(limit: int = 100):
     try:
-        result_list = graph.find_users_with_most_followers(limit=limit)
+        result_list = await async_graph.find_users_with_most_followers(limit=limit)
         return result_list
     except Exception as e:
         raise HTTPException(status_code=500, detail="An error occurred processing your request")
     
 
 @app.get('/users/follow_most', tags=["neo4j"])
-def users_follow_most(limit: int = 100, followed_users: str = None):
+async def users_follow_most(limit: int = 100, followed_users: str = None):
     try:
         if followed_users:
-            followed_users_list = followed_users.split(',')
+            followed_users_list = [int(followed_user) for followed_user in followed_users.split(',')]
         else:
             # get the followed users from graph.find_users_with_most_followers
-            followed_users_list = graph.find_users_with_most_followers(limit=limit)
+            followed_users_list = await async_graph.find_users_with_most_followers(limit=limit)
             followed_users_list = [record['user'] for record in followed_users_list]
-        result_list = graph.find_users_which_follow_most(limit=limit, followed_users=followed_users_list)
+        result_list = await async_graph.find_users_which_follow_most(limit=limit, followed_users=followed_users_list)
         return result_list
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -120,45 +224,75 @@ def users_follow_most(limit: int = 100, followed_users: str = None):
     
 
 @app.get('/users/follow_stats', tags=["neo4j"])
-def user_follow_stats(user_id: int = 40981798):
+async def user_follow_stats(user_id: int = 40981798):
     if not user_id:
         raise HTTPException(status_code=400, detail="Missing user_id parameter")
     try:
-        follow_stats = graph.get_user_follow_stats(str(user_id))
+        follow_stats = await async_graph.get_user_follow_stats(user_id)
         return follow_stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get('/users/user_follows', tags=["neo4j"])
-def get_followed_users(user_id: int = 40981798):
+async def get_followed_users(user_id: int = 40981798):
     if not user_id:
         raise HTTPException(status_code=400, detail="Missing user_id parameter")
     try:
-        followed_users = graph.get_followed_users(str(user_id))
+        followed_users = await async_graph.get_followed_users(user_id)
         return followed_users
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get('/users/user_followers', tags=["neo4j"])
-def get_followers(user_id: int = 40981798):
+async def get_followers(user_id: int = 40981798):
     if not user_id:
         raise HTTPException(status_code=400, detail="Missing user_id parameter")
     try:
-        followers = graph.get_followers(str(user_id))
+        followers = await async_graph.get_followers(user_id)
         return followers
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get('/users/get_all', tags=["neo4j"])
-def get_all_users():
+@app.get('/users/neighbors_many', tags=["neo4j"], description="Returns the followers (or followed users) of several users at once, "
+                                                                 "`user_ids` is a comma separated list of user ids")
+async def get_neighbors_many(user_ids: str, direction: str = Query("followers", description="'followers' or 'followed'")):
     try:
-        all_users = graph.get_all_users()
+        user_ids_list = [int(user_id) for user_id in user_ids.split(',')]
+        return await async_graph.get_neighbors_many(user_ids_list, direction=direction)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred processing your request")
+
+@app.get('/users/get_all', tags=["neo4j"], description="Returns all user ids. Set `page_size` (and `after_id` from the previous page) to get a single page, "
+                                                          "or `stream=True` for a newline delimited JSON stream of all ids")
+async def get_all_users(after_id: Optional[int] = None, page_size: Optional[int] = None, stream: bool = False):
+    if page_size is not None and page_size <= 0:
+        raise HTTPException(status_code=400, detail="page_size must be a positive integer")
+    try:
+        if stream:
+            lines = (f"{user_id}\n" async for user_id in async_graph.iter_all_users(page_size=page_size or 10000))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        if page_size is not None:
+            users = await async_graph.get_users_page(after_id=after_id, page_size=page_size)
+            next_after_id = users[-1] if len(users) == page_size else None
+            return {"users": users, "next_after_id": next_after_id}
+        all_users = await async_graph.get_all_users()
         return all_users
     except Exception as e:
         raise HTTPException(status_code=500, detail="An error occurred processing your request")
 
-@app.get('/status', tags=["all"])
-def status():
+@app.get('/users/sample', tags=["neo4j"])
+async def sample_users(n: int = 100):
+    if n <= 0:
+        raise HTTPException(status_code=400, detail="n must be a positive integer")
+    try:
+        return await async_graph.sample_users(n)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred processing your request")
+
+@app.get('/status', tags=["all"], description="Availability of both databases with their user and tweet counts, read from maintained counters")
+def status(estimated: bool = Query(False, description="Estimate the tweet count from the Cassandra size estimates instead of the tweets counter")):
     try:
         # Check Graph Database status
         try:
@@ -169,7 +303,7 @@ def status():
         
         # Check Cassandra status
         try:
-            tweet_count = tweet_db.get_tweet_count()
+            tweet_count = tweet_db.get_tweet_count(estimated=estimated)
             cassandra_status = f"available with {tweet_count} tweets"
         except Exception as e:
             cassandra_status = "unavailable"
@@ -185,72 +319,84 @@ def status():
 
 
 @app.post("/import_tweets", tags=["cassandra"])
-def import_tweets(MAX_USERS: int = 20, csv_file: str = 'data/tweets.csv', limit: int = None):
+def import_tweets(MAX_USERS: int = 20, csv_file: str = 'data/tweets.csv', limit: int = None,
+                  concurrency: int = Query(100, description="Number of concurrent inserts"),
+                  resume: bool = Query(False, description="Continue an interrupted import after its last committed chunk")):
     try:
-        user_nodes = users_with_most_followers(limit=MAX_USERS)
+        user_nodes = graph.find_users_with_most_followers(limit=MAX_USERS)
         tweet_db.setup_all_tables()
         
-        tweet_db.import_csv(csv_file, user_nodes, limit=limit)
+        tweet_db.import_csv(csv_file, user_nodes, limit=limit, concurrency=concurrency, resume=resume)
 
         return {"message": "Tweets imported successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
     
 @app.get("/tweets/get_tweets_by_user", tags=["cassandra"])
-def get_tweets_by_user(user_id: int = 40981798, limit: int = 25):
+def get_tweets_by_user(user_id: int = 40981798, limit: int = 25,
+                       cursor: Optional[str] = Query(None, description="next_cursor of the previous page, to get the following older tweets")):
     try:
-        newest_tweets = tweet_db.get_tweets_by_user_ids([user_id], limit)
-        return {'tweets': newest_tweets}
+        paging_state = base64.urlsafe_b64decode(cursor.encode()) if cursor else None
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        newest_tweets, paging_state = tweet_db.get_tweets_page(user_id, page_size=limit, paging_state=paging_state)
+        next_cursor = base64.urlsafe_b64encode(paging_state).decode() if paging_state else None
+        return {'tweets': newest_tweets, 'next_cursor': next_cursor}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
     
 @app.get("/tweets/get_tweets", tags=["cassandra"])
-def get_tweets(user_id: int = 40981798, by_date: bool = True, filter_words: List[str] = Query(None), limit: int = 25):
+def get_tweets(user_id: int = 40981798, by_date: bool = True, filter_words: List[str] = Query(None), limit: int = 25,
+               use_word_index: bool = Query(True, description="Match filter_words as whole words from the word index, instead of filtering the newest tweets of every followed user"),
+               cursor: Optional[str] = Query(None, description="next_cursor of the previous page, to get the following tweets")):
     try:
-        user_follows_data = get_followed_users(str(user_id))
+        after = tweet_db.decode_cursor(cursor, by_likes=not by_date) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        user_follows_data = graph.get_followed_users(user_id)
         if not isinstance(user_follows_data, list):
             raise TypeError("Unexpected data format: user_follows_data is not a list")
 
         user_follows = [int(uf['followed']) for uf in user_follows_data if 'followed' in uf]
 
-        newest_tweets = tweet_db.get_tweets_by_user_ids(user_follows, limit, filter_words=filter_words, by_likes=not by_date)
-        return {'tweets': newest_tweets}
+        newest_tweets = tweet_db.get_tweets_by_user_ids(user_follows, limit, filter_words=filter_words, by_likes=not by_date,
+                                                        use_word_index=use_word_index, after=after)
+        next_cursor = tweet_db.encode_cursor(newest_tweets[-1], by_likes=not by_date) if len(newest_tweets) == limit else None
+        return {'tweets': newest_tweets, 'next_cursor': next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-@app.post("/tweets/like_tweet", tags=["cassandra"], description="Likes a tweet by a user if tweet_id is not provided, the latest tweet by the follower is liked")
-def like_tweet(user_id: int = 40981798, follower_id: int = 279787626, tweet_id: Optional[str] = None, 
-               tweet_date: Optional[str] = Query(None, description="The date of the tweet in the format 'YYYY-MM-DDTHH:MM:SS.ssssss'")):
+@app.post("/tweets/like_tweet", tags=["cassandra"], description="Likes a tweet by a user if tweet_id is not provided, the latest tweet of the follower's timeline is liked")
+def like_tweet(follower_id: int = 279787626, tweet_id: Optional[str] = None):
     try:
-        user_followers = get_followers(str(user_id))
-        user_followers = [int(uf['follower']) for uf in user_followers]
-        if not tweet_id and not tweet_date:
+        tweet_id = UUID(tweet_id) if tweet_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid tweet_id")
+    try:
+        if tweet_id is None:
             logger.info('The latest tweet is being liked')
-            # get the tweet data
-            query = "SELECT tweet_id, number_of_likes, tweet_date, content FROM tweets_cache WHERE follower_id = %s LIMIT 1"
-            result = tweet_db.session.execute(query, (follower_id,))
-            row = result.one()
-            tweet_id = row.tweet_id
-        else:
-            logger.info('Getting the tweet data for the tweet_id')
-            # get the tweet data
-            query = """
-                    SELECT number_of_likes, tweet_date, content
-                    FROM tweets_cache
-                    WHERE follower_id = %s AND tweet_date = %s AND tweet_id = %s
-                    LIMIT 1
-                """
-            # Validate tweet_date format
-            tweet_date = validate_tweet_date(tweet_date)
-            tweet_id = UUID(tweet_id)
-            result = tweet_db.session.execute(query, (follower_id, tweet_date, tweet_id))
-            row = result.one()
-        number_of_likes = row.number_of_likes
-        tweet_date = row.tweet_date
-        content = row.content
-        # like the tweet
-        tweet_db.like_tweet(user_id, follower_id, tweet_id, number_of_likes, tweet_date, content, user_followers)
-        return {"message": "Tweet liked successfully"}
+            # the newest tweet of the timeline, tweets of pulled authors included
+            pull_author_ids = None
+            if tweet_db.fanout_threshold is not None:
+                pull_author_ids = graph.get_followed_users_above(follower_id, tweet_db.fanout_threshold)
+            timeline = tweet_db.get_tweets_from_cache(follower_id, 1, pull_author_ids=pull_author_ids)
+            if not timeline:
+                raise HTTPException(status_code=404, detail="The timeline of the follower is empty")
+            tweet_id = timeline[0].tweet_id
+        # author and date of the tweet
+        tweet = tweet_db.get_tweet(tweet_id)
+        if tweet is None:
+            raise HTTPException(status_code=404, detail="Tweet not found")
+        # like the tweet, the like totals are written by the like buffer
+        if not tweet_db.like_tweet(tweet.user_id, follower_id, tweet_id, tweet.tweet_date):
+            return {"message": "Tweet was already liked by the user", "tweet_id": str(tweet_id)}
+        return {"message": "Tweet liked successfully", "tweet_id": str(tweet_id)}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to like tweet: {e}")
         raise HTTPException(status_code=500, detail="An error occurred liking the tweet")
@@ -267,7 +413,7 @@ def update_cache(user_id: int = 40981798, tweets: List[str] = Query(None), initi
     try:
         if initial:
             # get tweets from the the followed users
-            user_follows_data = get_followed_users(str(user_id))
+            user_follows_data = graph.get_followed_users(user_id)
             user_follows = [int(uf['followed']) for uf in user_follows_data if 'followed' in uf]
             tweets = tweet_db.get_tweets_by_user_ids(user_follows, num_tweets, filter_words=None, by_likes=sorted_by_likes)  
         tweet_db.update_cache(user_id, tweets)
@@ -276,22 +422,36 @@ def update_cache(user_id: int = 40981798, tweets: List[str] = Query(None), initi
         raise HTTPException(status_code=500, detail="An error occurred updating the cache")
     
 @app.get("/tweets/get_tweets_from_cache", tags=["cassandra"])
-def get_tweets_from_cache(user_id: int = 40981798, limit: int = 25):
+def get_tweets_from_cache(user_id: int = 40981798, limit: int = 25,
+                          cursor: Optional[str] = Query(None, description="next_cursor of the previous page, to get the following older tweets")):
+    try:
+        after = tweet_db.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        cached_tweets = tweet_db.get_tweets_from_cache(int(user_id), limit)
-        return {'tweets': cached_tweets}
+        pull_author_ids = None
+        if tweet_db.fanout_threshold is not None:
+            # followed authors above the threshold are merged in at read time
+            pull_author_ids = graph.get_followed_users_above(user_id, tweet_db.fanout_threshold)
+        cached_tweets = tweet_db.get_tweets_from_cache(int(user_id), limit, pull_author_ids=pull_author_ids, after=after)
+        next_cursor = tweet_db.encode_cursor(cached_tweets[-1]) if len(cached_tweets) == limit else None
+        return {'tweets': cached_tweets, 'next_cursor': next_cursor}
     except Exception as e:
         logger.error(f"Failed to get tweets from cache: {e}")
         raise HTTPException(status_code=500, detail="An error occurred getting tweets from cache")
     
-@app.post("/tweets/init_random_likes", tags=["cassandra"])
-def init_random_likes(user_id: int = 40981798, num_likes: int = 10, num_tweets: int = 10):
+@app.post("/tweets/init_random_likes", tags=["cassandra"],
+          description="Likes the newest num_tweets tweets of every given user by num_likes random users each and updates the like totals")
+def init_random_likes(user_id: int = 40981798, num_likes: int = 10, num_tweets: int = 10,
+                      user_ids: List[int] = Query(None, description="Seed the likes of several users at once, user_id is used if empty"),
+                      concurrency: int = 100):
     try:
-        results = get_all_users()
+        user_ids = user_ids or [user_id]
+        # only a random pool of likers is needed, not the whole user set
+        results = graph.sample_users(num_likes * num_tweets)
         possible_user_ids = [int(user) for user in results]
-        # init_random_likes(self, user_id, liker_ids, n_likes=10, n_tweets=10):
-        tweet_db.init_random_likes(user_id, possible_user_ids, num_likes, num_tweets)
-        return {"message": "Random likes initialized successfully"}
+        added = tweet_db.init_random_likes(user_ids, possible_user_ids, num_likes, num_tweets, concurrency=concurrency)
+        return {"message": "Random likes initialized successfully", "likes": added}
     except Exception as e:
         raise HTTPException(status_code=500, detail="An error occurred initializing random likes")
 
@@ -307,14 +467,62 @@ def get_likes(limit: int = 5):
 @app.post("/tweets/post_tweet", tags=["cassandra"])
 def post_tweet(user_id: int = 40981798, tweet_content: str = Form(...)):
     try:
-        user_followers = get_followers(str(user_id))
+        user_followers = graph.get_followers(user_id)
         user_followers = [int(uf['follower']) for uf in user_followers]
-        tweet_db.post_tweet(user_id, tweet_content, user_followers)
-        return {"message": "Tweet posted successfully"}
+        followers_count = None
+        if tweet_db.fanout_threshold is not None:
+            # the stored count, which get_followed_users_above selects the pulled authors by
+            followers_count = graph.get_user_follow_stats(user_id)["followersCount"]
+        tweet = tweet_db.post_tweet(user_id, tweet_content, user_followers, followers_count=followers_count)
+        return {"message": "Tweet posted successfully", "tweet_id": str(tweet['tweet_id'])}
     except Exception as e:
         logger.error(f"Failed to get tweets from cache: {e}")
         raise HTTPException(status_code=500, detail="An error occurred posting the tweet")
 
+@app.get("/tweets/fanout_status", tags=["cassandra"], description="Counters and lag of the background fan-out of posted tweets into the followers' caches")
+def fanout_status():
+    try:
+        return {**tweet_db.fanout.stats(), "fanout_threshold": tweet_db.fanout_threshold, **tweet_db.timeline_stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred getting the fan-out status")
+
+@app.get("/tweets/like_status", tags=["cassandra"], description="Counters of the like buffer, which coalesces likes per tweet before the like totals are written")
+def like_status():
+    try:
+        return tweet_db.likes.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred getting the like status")
+
+@app.post("/tweets/recount_tweets", tags=["cassandra"], description="Sets the tweets counter used by /status from a full count of the tweets, for data imported before the counter existed")
+def recount_tweets():
+    try:
+        return {"message": "Tweets recounted successfully", "tweets": tweet_db.recount_tweets()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred recounting the tweets")
+
+@app.post("/tweets/backfill_tweets_by_id", tags=["cassandra"], description="Copies the tweets stored before the timeline cache referenced tweets_by_id into that table, so their cache entries can be hydrated")
+def backfill_tweets_by_id(page_size: int = 5000):
+    try:
+        return {"message": "tweets_by_id backfilled successfully", **tweet_db.backfill_tweets_by_id(page_size=page_size)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred backfilling tweets_by_id")
+
+@app.post("/tweets/migrate_cache_table", tags=["cassandra"], description="Drops a tweets_cache of the old layout, which holds copies of the tweets, and creates it with references to tweets_by_id. The timeline caches are empty afterwards")
+def migrate_cache_table():
+    try:
+        migrated = tweet_db.migrate_cache_table()
+        return {"message": "tweets_cache migrated successfully" if migrated else "tweets_cache already has the current layout",
+                "migrated": migrated}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred migrating tweets_cache")
+
+@app.post("/tweets/backfill_tweets_by_word", tags=["cassandra"], description="Writes the word index postings of the tweets stored before the word index existed, so filter_words finds them")
+def backfill_tweets_by_word(page_size: int = 5000):
+    try:
+        return {"message": "tweets_by_word backfilled successfully", **tweet_db.backfill_tweets_by_word(page_size=page_size)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="An error occurred backfilling tweets_by_word")
+
 @app.post("/tweets/clean_database", tags=["cassandra"])
 def clean_database():
     try: